@@ -0,0 +1,208 @@
+"""
+This module implements a batched entry point to decide on the next action of many agents acting in the same problem.
+
+Rather than calling mcts() once per agent, mcts_batch() accepts the states of all agents together with one shared
+ budget, which is split evenly over the distinct states; agents in the same state share a single search.
+ The searches of a batch share their caches: a CachedProblem memoises the applicable actions, the goal checks and
+ the successor states, and a transposition table lets a later search continue from the subtree of an earlier search
+ that already reached its root state. With a deterministic rollout heuristic, a RolloutCache can also be shared to
+ memoise the return of rollouts; for a randomised heuristic it would freeze one sampled return per state instead.
+ Optionally, the distinct states are spread over a pool of worker processes, each with its own shared caches.
+ Such a pool, and its caches, only lasts for a single batch, unless a long-lived BatchPool is passed instead.
+"""
+from multiprocessing import Pool, cpu_count
+
+from budget import iteration_budget, timed_budget
+from cache import LRUCache, RolloutCache
+from mcts import mcts
+from search_structure import Node
+
+__author__ = "Kim Bauters"
+
+
+class CachedProblem:
+    """ A proxy for a Problem which memoises the applicable actions, goal checks, and successor states of states.
+        All other attributes are looked up on the wrapped problem, so it can be used wherever a Problem is used. """
+    def __init__(self, problem, maxsize=100000):
+        """
+        :param problem: the problem to wrap
+        :param maxsize: the maximum number of entries to keep in each of the caches
+        """
+        self.problem = problem
+        self.applicable = LRUCache(maxsize)  # the actions applicable in a state, as a tuple
+        self.goals = LRUCache(maxsize)  # whether a state is a goal
+        self.successors = LRUCache(maxsize)  # the state resulting from an effect in a state
+
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
+
+    def goal_reached(self, state):
+        """ Verify if a given state satisfies at least one of the goals, see Problem.goal_reached. """
+        state = frozenset(state)
+        reached = self.goals.get(state)
+        if reached is None:
+            reached = self.problem.goal_reached(state)
+            self.goals.put(state, reached)
+        return reached
+
+    def applicable_actions(self, state):
+        """ Determine the actions applicable in a given state, see Problem.applicable_actions. """
+        state = frozenset(state)
+        actions = self.applicable.get(state)
+        if actions is None:
+            actions = tuple(self.problem.applicable_actions(state))
+            self.applicable.put(state, actions)
+        return list(actions)  # nodes remove the actions they try, so every caller gets its own list
+
+    def successor(self, state, effect):
+        """ Determine the state resulting from an effect occurring in a given state, see Problem.successor. """
+        key = (frozenset(state), effect)
+        state = self.successors.get(key)
+        if state is None:  # states are shared between all the nodes reaching them, which also saves memory
+            state = frozenset(self.problem.successor(key[0], effect))
+            self.successors.put(key, state)
+        return state
+
+
+# the context of the searches in a worker process, set up once by _initialise
+_context = None
+
+
+def _create_context(problem, horizon, cache_size, share_rollouts, search_options):
+    """ Create the context of a series of searches, consisting of the problem, the horizon, the shared rollout cache
+        (if any), and the search options. The problem is wrapped in a CachedProblem, which is shared as well. """
+    rollout_cache = RolloutCache(cache_size) if share_rollouts else None
+    return CachedProblem(problem, cache_size), horizon, rollout_cache, search_options
+
+
+def _initialise(*arguments):
+    """ Set up the context of the searches in a worker process. """
+    global _context
+    _context = _create_context(*arguments)
+
+
+def _search(task, context=None):
+    """ Decide on the next action for each of a number of (distinct) states, one search after the other.
+    :param task: a pair of the list of states and a pair (iterations, seconds) with the budget of each search
+    :param context: the context of the searches; defaults to the context of the worker process
+    :return: the list of the index of the chosen action in the problem, or None, for each of the states """
+    states, (iterations, seconds) = task
+    problem, horizon, rollout_cache, search_options = context or _context
+    index = {action: position for position, action in enumerate(problem.actions)}
+    transpositions = {}  # the most visited node for each state in the search trees of earlier searches
+    decisions = []
+    for state in states:
+        if problem.goal_reached(state) or not problem.applicable_actions(state):
+            decisions.append(None)  # there is nothing left to decide in this state
+            continue
+        root = transpositions.pop(state, None)
+        if root is None:
+            root = Node(problem, None, None, None, state)
+        elif root.parent is not None:  # continue from the subtree of an earlier search, after detaching it
+            root.detach()
+        budget = iteration_budget(iterations) if iterations is not None else timed_budget(seconds)
+        action = mcts(state, problem, budget, horizon, root=root, rollout_cache=rollout_cache, **search_options)
+        decisions.append(index[action])
+        stack = [root]
+        while stack:  # index the search tree, so that later searches can continue from its subtrees
+            node = stack.pop()
+            if node.tried_actions:
+                if node.visits > getattr(transpositions.get(node.state), "visits", 0):
+                    transpositions[node.state] = node
+                stack.extend(node.children.values())
+    return decisions
+
+
+class BatchPool:
+    """ A pool of worker processes for mcts_batch() which outlives a single batch, so that the caches of its workers
+        are shared by all the batches it is used for, for example:
+            with BatchPool(problem, 50, workers=4) as pool:
+                actions = mcts_batch(states, problem, 50, iterations=10000, pool=pool) """
+    def __init__(self, problem, horizon, workers=None, cache_size=100000, share_rollouts=False, **search_options):
+        """
+        :param problem: the problem of the searches
+        :param horizon: the maximum depth up to which to explore the search trees
+        :param workers: the number of worker processes; defaults to the number of CPUs
+        :param cache_size: the maximum number of entries of each cache of a worker
+        :param share_rollouts: whether each worker shares a RolloutCache between its searches, see mcts_batch()
+        :param search_options: any further named arguments to pass on to mcts()
+        """
+        self.problem = problem
+        self.horizon = horizon
+        self.workers = workers or cpu_count()
+        self._pool = Pool(self.workers, initializer=_initialise,
+                          initargs=(problem, horizon, cache_size, share_rollouts, search_options))
+
+    def map(self, tasks):
+        """ Perform the searches of a number of tasks in the worker processes, see _search. """
+        return self._pool.map(_search, tasks)
+
+    def close(self):
+        """ Stop the worker processes. """
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def mcts_batch(root_states, problem, horizon, *, iterations=None, seconds=None, workers=None, cache_size=100000,
+               share_rollouts=False, pool=None, **search_options):
+    """ Decide on the next action for each of many states in the same problem, sharing one budget and the caches.
+    :param root_states: the states in which to decide on an action, e.g. one per agent
+    :param problem: a description of the problem in the form of a Problem instance data structure
+    :param horizon: the maximum depth up to which to explore the search trees
+    :param iterations: can only be given as named parameter; the total number of iterations of all searches
+    :param seconds: can only be given as named parameter; the total (wall-clock) time for all searches;
+                    exactly one of iterations and seconds should be given
+    :param workers: can only be given as named parameter; the number of processes to spread the searches over;
+                    by default, all searches are performed one after the other in this process; the processes,
+                    and their caches, only last for this batch
+    :param cache_size: can only be given as named parameter; the maximum number of entries of each shared cache
+    :param share_rollouts: can only be given as named parameter; whether to share a RolloutCache between the
+                           searches, which should only be done with a (nearly) deterministic rollout_action,
+                           e.g. policies.greedy_rollout_action with an epsilon of 0, which only breaks ties randomly
+    :param pool: can only be given as named parameter; a BatchPool for the same problem and horizon to perform the
+                 searches in, so that the caches of its workers are reused across batches; the cache size, the
+                 sharing of rollouts, and the search options are then those of the pool
+    :param search_options: any further named arguments to pass on to mcts(); with workers, these are passed on
+                           to the processes when they start, which requires them to be picklable on platforms
+                           that do not fork processes
+    :return: the list of the next best action for each of the states, or None for states without any decision,
+             i.e. goal states and states in which no action is applicable
+    :raises: a ValueError if not exactly one of iterations and seconds is given, or if a pool is given for another
+             problem or horizon, or together with search options """
+    if (iterations is None) == (seconds is None):
+        raise ValueError("exactly one of iterations and seconds should be given")
+    if pool is not None:
+        if pool.problem is not problem or pool.horizon != horizon:
+            raise ValueError("the pool was created for a different problem or horizon")
+        if search_options:
+            raise ValueError("the search options of a pool are fixed when the pool is created")
+        workers = pool.workers
+    root_states = [frozenset(state) for state in root_states]
+    distinct = list(dict.fromkeys(root_states))  # agents in the same state share a single search
+    if not distinct:
+        return []
+    processes = min(workers, len(distinct)) if workers else 1
+    if iterations is not None:
+        budget = (max(1, iterations // len(distinct)), None)
+    else:  # each process performs its share of the searches one after the other
+        budget = (None, seconds * processes / len(distinct))
+    if workers:
+        tasks = [(distinct[index::processes], budget) for index in range(processes)]
+        if pool is not None:
+            results = pool.map(tasks)
+        else:
+            with BatchPool(problem, horizon, processes, cache_size, share_rollouts, **search_options) as batch_pool:
+                results = batch_pool.map(tasks)
+        decisions = {}
+        for (states, _), result in zip(tasks, results):
+            decisions.update(zip(states, result))
+    else:
+        context = _create_context(problem, horizon, cache_size, share_rollouts, search_options)
+        decisions = dict(zip(distinct, _search((distinct, budget), context)))
+    return [None if decisions[state] is None else problem.actions[decisions[state]] for state in root_states]
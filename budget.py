@@ -0,0 +1,75 @@
+"""
+This module provides generator functions for the computational budgets used by mcts().
+
+A budget is a function that is called before each MCTS iteration with the number of iterations
+ completed so far and the root node of the search tree; it returns True to continue searching,
+ or False to stop. Budgets can use the statistics in root.tried_actions to stop as soon as the
+ decision has converged, rather than only after a fixed amount of iterations or time.
+"""
+import math
+from time import perf_counter
+
+__author__ = "Kim Bauters"
+
+
+# generator function to create functions that will return False after a number of allowed iterations
+def iteration_budget(allowed_iterations):
+
+    def inner_iteration_budget(iterations, _=None):
+        return iterations < allowed_iterations
+    return inner_iteration_budget
+
+
+# generator function to create functions that will return False after a set amount of seconds have passed
+def timed_budget(allowed_secs):
+    start_time = None
+
+    def inner_timed_budget(iterations, _=None):
+        nonlocal start_time  # use the start time in the closure
+        if not start_time or not iterations:  # if it hasn't been set, or a new search started ...
+            start_time = perf_counter()  # set it to now
+        if perf_counter() - start_time > allowed_secs:  # check if the allowed have been reached
+            start_time = None  # if so, reset the start_time to None for a next run
+            return False  # and return False to indicate the iteration should stop
+        else:
+            return True  # continue until the allotted number of seconds is reached
+    return inner_timed_budget
+
+
+# generator function to create functions that will return False after a number of allowed iterations,
+# or as soon as the most visited action in the root can no longer be overtaken in the remaining iterations;
+# as this only guarantees that the most visited action does not change, use it with select_best=mcts.most_visited
+def convergence_budget(allowed_iterations, min_iterations=0):
+
+    def inner_convergence_budget(iterations, root):
+        if iterations >= allowed_iterations:
+            return False
+        if iterations < min_iterations or len(root.tried_actions) < 2:  # there is always a decision to make
+            return True
+        # determine the visits of the most and the second most visited action in the root
+        first, second = sorted((visits for _, visits in root.tried_actions.values()), reverse=True)[:2]
+        return first - second <= allowed_iterations - iterations  # continue while the lead can still be overtaken
+    return inner_convergence_budget
+
+
+# generator function to create functions that will return False once the given budget is exhausted,
+# or as soon as the confidence bound on the average reward of the best action in the root separates from all others
+def confidence_budget(budget, confidence=0.95, reward_range=1, min_visits=10):
+    # the half-width of the interval, for an action visited once, based on Hoeffding's inequality
+    width = reward_range * math.sqrt(math.log(2 / (1 - confidence)) / 2)
+
+    def inner_confidence_budget(iterations, root):
+        if not budget(iterations, root):
+            return False
+        bounds = []  # for each action, the lower and upper bound on its average reward
+        for reward, visits in root.tried_actions.values():
+            if visits < min_visits:  # do not trust the bounds of actions that are barely explored
+                return True
+            mean, half_width = reward / visits, width / math.sqrt(visits)
+            bounds.append((mean - half_width, mean + half_width))
+        if len(bounds) < 2 or root.untried_actions:  # all actions need to be explored before we can separate them
+            return True
+        bounds.sort(key=lambda bound: bound[0], reverse=True)
+        best_lower = bounds[0][0]
+        return any(upper >= best_lower for _, upper in bounds[1:])  # continue while the bounds still overlap
+    return inner_confidence_budget
@@ -0,0 +1,76 @@
+"""
+This module provides bounded caches that can be shared across MCTS iterations and across decisions.
+"""
+from collections import OrderedDict
+
+__author__ = "Kim Bauters"
+
+
+class LRUCache:
+    """ A dictionary-like cache of bounded size, which evicts the least recently used entry when it is full. """
+    def __init__(self, maxsize=100000):
+        """
+        :param maxsize: the maximum number of entries to keep in the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0  # number of successful lookups so far
+        self.misses = 0  # number of failed lookups so far
+        self._entries = OrderedDict()  # the entries, ordered from least to most recently used
+
+    def get(self, key, default=None):
+        """ Look up an entry, and mark it as the most recently used one.
+        :param key: the key of the entry
+        :param default: the value to return when there is no entry for the key
+        :return: the value of the entry, or the default value if there is no such entry """
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Add or replace an entry, evicting the least recently used entry if the cache is full.
+        :param key: the key of the entry
+        :param value: the value of the entry """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """ Remove an entry from the cache.
+        :param key: the key of the entry
+        :param default: the value to return when there is no entry for the key
+        :return: the value of the removed entry, or the default value if there is no such entry """
+        return self._entries.pop(key, default)
+
+    def items(self):
+        """ List the entries of the cache, from least to most recently used, without marking them as used.
+        :return: a list of (key, value) pairs """
+        return list(self._entries.items())
+
+    def clear(self):
+        """ Remove all entries from the cache. """
+        self._entries.clear()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + str(len(self)) + "/" + str(self.maxsize) + " entries, " + \
+            str(self.hits) + " hits, " + str(self.misses) + " misses)"
+
+
+class RolloutCache(LRUCache):
+    """ A cache of the discounted return of determinised rollouts, which always follow the most probable effect.
+        Entries are key-ed by the (frozen) state the rollout starts from and the number of steps left before the
+        horizon, and map to a pair of the discounted return and the number of steps the rollout took.
+        For a deterministic rollout heuristic the rollout is fully determined by this key, so repeated rollouts
+        become lookups; for a randomised heuristic the cache instead keeps one sampled return per key.
+        A cache should only be shared between searches using the same problem, rollout heuristic and discounting. """
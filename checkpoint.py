@@ -0,0 +1,179 @@
+"""
+This module implements compact binary checkpoints of search trees, so that long searches can be resumed later.
+
+A checkpoint file starts with a header identifying the problem and listing its atoms, followed by node records.
+ Each node record holds the node id, the id of its parent, the index of the action and of the effect (in the Problem)
+ leading to it, its visits and utility, its state as a bitset over the atoms, and the statistics of its tried actions.
+ A Checkpointer only appends the records of nodes that are new or changed since its previous save, and records of
+ the same node id later in the file supersede earlier ones; parents are always recorded before their children.
+ A record without a parent marks the root of the tree, so a search tree can be re-rooted between saves, e.g. at the
+ subtree for the observed outcome of the chosen action; the tree is resumed from the root recorded last.
+ Checkpoints are loaded record by record, so a checkpoint can be resumed by passing the loaded root to mcts(),
+ or used read-only, e.g. to serve decisions from a precomputed search tree.
+"""
+import struct
+import weakref
+from itertools import count
+
+from search_structure import Node
+
+__author__ = "Kim Bauters"
+
+
+MAGIC = b"SPCK"  # identifies a checkpoint file
+VERSION = 1  # the version of the checkpoint file format
+_HEADER = struct.Struct("<4sHI")  # magic, version, number of atoms
+_LENGTH = struct.Struct("<I")  # length of the string that follows
+_NODE = struct.Struct("<IiiiIdI")  # node id, parent id, action index, effect index, visits, utility, tried actions
+_TRIED = struct.Struct("<IdI")  # action index, utility, visits
+
+
+def _write_string(file, value):
+    data = value.encode("utf-8")
+    file.write(_LENGTH.pack(len(data)) + data)
+
+
+def _read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise EOFError("the checkpoint file ends in the middle of a record")
+    return data
+
+
+def _read_string(file):
+    length, = _LENGTH.unpack(_read_exactly(file, _LENGTH.size))
+    return _read_exactly(file, length).decode("utf-8")
+
+
+class Checkpointer:
+    """ Save a search tree to a checkpoint file incrementally, writing only what changed since the previous save. """
+    def __init__(self, location, problem):
+        """
+        :param location: the location of the checkpoint file; an existing file is overwritten
+        :param problem: the problem of the search trees to save
+        """
+        self.location = location
+        self.problem = problem
+        self.atoms = sorted(problem.atoms())
+        self._atom_bits = {atom: 1 << index for index, atom in enumerate(self.atoms)}
+        self._state_size = (len(self.atoms) + 7) // 8  # the number of bytes needed for a state
+        self._actions = {action: index for index, action in enumerate(problem.actions)}
+        # both are key-ed weakly, so that the checkpointer does not keep released search trees alive
+        self._ids = weakref.WeakKeyDictionary()  # the id assigned to each node saved so far
+        self._saved = weakref.WeakKeyDictionary()  # the visits of each node at the time it was saved last
+        self._next_id = count()  # ids are never reused, even when the nodes they were assigned to are released
+        self._root_id = None  # the id of the root of the latest save
+        with open(location, "wb") as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, len(self.atoms)))
+            _write_string(file, problem.name)
+            for atom in self.atoms:
+                _write_string(file, atom)
+
+    def save(self, root):
+        """ Append the nodes of the search tree that are new or changed since the previous save to the checkpoint.
+        :param root: the root node of the search tree
+        :return: the number of node records written """
+        records = []
+        stack = [(root, -1)]
+        while stack:  # traverse the tree depth-first, so that parents are always recorded before their children
+            node, parent_id = stack.pop()
+            node_id = self._ids.get(node)
+            if node_id is None:
+                node_id = self._ids[node] = next(self._next_id)
+            if node_id == self._root_id or parent_id >= 0:
+                changed = self._saved.get(node) != node.visits  # only record the nodes which are new or changed
+            else:  # a new root is always recorded, as it should no longer be linked to its earlier parent
+                changed = True
+                self._root_id = node_id
+            if changed:
+                self._saved[node] = node.visits
+                records.append(self._encode(node, node_id, parent_id))
+                for (action, _), child in node.children.items():
+                    if action in node.tried_actions:
+                        stack.append((child, node_id))
+        with open(self.location, "ab") as file:
+            file.write(b"".join(records))
+        return len(records)
+
+    def _encode(self, node, node_id, parent_id):
+        """ Encode a single node as a record.
+        :return: the record as bytes """
+        if node.action is None or parent_id < 0:
+            action_index, effect_index = -1, -1
+        else:
+            action_index = self._actions[node.action]
+            effect_index = node.action.effects.index(node.effect)
+        state = sum(self._atom_bits[atom] for atom in node.state)
+        record = [_NODE.pack(node_id, parent_id, action_index, effect_index, node.visits, node.utility,
+                             len(node.tried_actions)), state.to_bytes(self._state_size, "little")]
+        for action, (utility, visits) in node.tried_actions.items():
+            record.append(_TRIED.pack(self._actions[action], utility, visits))
+        return b"".join(record)
+
+
+def checkpoint_budget(budget, checkpointer, every=1000):
+    """ Wrap a budget so that the search tree is checkpointed every so many iterations, and when the search stops.
+    :param budget: the budget to wrap
+    :param checkpointer: the Checkpointer to save the search tree with
+    :param every: the number of iterations between checkpoints
+    :return: the wrapped budget """
+
+    def inner_checkpoint_budget(iterations, root):
+        carry_on = budget(iterations, root)
+        if not carry_on or (iterations and iterations % every == 0):
+            checkpointer.save(root)
+        return carry_on
+    return inner_checkpoint_budget
+
+
+def load_checkpoint(location, problem):
+    """ Load a search tree from a checkpoint file, one record at a time.
+    :param location: the location of the checkpoint file
+    :param problem: the problem of the search tree; it should be the problem the checkpoint was made for
+    :return: the root node of the search tree, i.e. the root recorded last
+    :raises: a ValueError if the file is not a checkpoint for the problem """
+    with open(location, "rb") as file:
+        magic, version, atom_count = _HEADER.unpack(_read_exactly(file, _HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("the file " + str(location) + " is not a (supported) checkpoint file")
+        name = _read_string(file)
+        atoms = [_read_string(file) for _ in range(atom_count)]
+        if name != problem.name or atoms != sorted(problem.atoms()):
+            raise ValueError("the checkpoint was made for a different problem than " + problem.name)
+        state_size = (atom_count + 7) // 8
+
+        nodes = {}  # the nodes loaded so far, key-ed by their id
+        while True:
+            header = file.read(_NODE.size)
+            if not header:
+                break
+            if len(header) != _NODE.size:
+                raise EOFError("the checkpoint file ends in the middle of a record")
+            node_id, parent_id, action_index, effect_index, visits, utility, tried = _NODE.unpack(header)
+            bits = int.from_bytes(_read_exactly(file, state_size), "little")
+            tried_actions = {}
+            for _ in range(tried):
+                index, action_utility, action_visits = _TRIED.unpack(_read_exactly(file, _TRIED.size))
+                tried_actions[problem.actions[index]] = (action_utility, action_visits)
+
+            node = nodes.get(node_id)
+            if parent_id < 0:  # the record of a root, which may be a node recorded earlier as part of another tree
+                root = node
+                if node is not None:
+                    node.detach()
+            if node is None:  # the first record of a node creates it, and links it to its parent
+                state = frozenset(atom for index, atom in enumerate(atoms) if bits >> index & 1)
+                if parent_id < 0:
+                    node = root = Node(problem, None, None, None, state)
+                else:
+                    parent = nodes[parent_id]
+                    action = problem.actions[action_index]
+                    effect = action.effects[effect_index]
+                    node = Node(problem, parent, action, effect, state)
+                    parent.add_child(node)
+                nodes[node_id] = node
+            node.restore(visits, utility, tried_actions)
+
+    if not nodes:
+        raise ValueError("the checkpoint file " + str(location) + " does not contain a search tree")
+    return root
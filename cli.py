@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+This module provides the command-line interface of sparsepy, with the subcommands:
+  plan      decide on the next action in a state of a problem
+  evaluate  run a number of episodes, deciding on each action with a search, and report the rewards obtained
+  compile   parse a PPDDL problem once, and save it as a compiled problem file
+  bench     measure the time to load a problem and the number of search iterations per second
+Problem files can either be PPDDL descriptions or compiled problem files (see problem_files.py). Compiled problem
+ files are loaded without importing the (Grako-based) parser at all, and all other modules are only imported once a
+ subcommand needs them, so that short-lived invocations spend their time searching rather than starting up.
+ The startup time, i.e. the time until the problem is loaded, is reported on stderr.
+"""
+from time import perf_counter
+_started = perf_counter()  # measure the startup time from the very first import onwards
+
+import argparse  # noqa: E402
+import sys  # noqa: E402
+
+from problem_files import load_problem, save_compiled  # noqa: E402
+
+__author__ = "Kim Bauters"
+
+
+def _budget(arguments):
+    """ Create the budget of a search from the command-line arguments. """
+    from budget import iteration_budget, timed_budget
+    if arguments.iterations is not None:
+        return iteration_budget(arguments.iterations)
+    return timed_budget(arguments.seconds)
+
+
+def _search_options(arguments, problem):
+    """ Create the named arguments of mcts() from the command-line arguments. """
+    from policies import ucb1_select_action
+    options = {"select_action": ucb1_select_action(arguments.exploration), "discounting": arguments.discounting}
+    if arguments.greedy_rollouts:
+        from heuristic import HFF
+        from policies import greedy_rollout_action
+        options["rollout_action"] = greedy_rollout_action(HFF(problem), epsilon=0.1)
+    return options
+
+
+def _load(arguments):
+    """ Load the problem given on the command line, and report the startup time. """
+    problem = load_problem(arguments.problem, simplify=getattr(arguments, "simplify", False))
+    print("startup took %0.3f seconds" % (perf_counter() - _started), file=sys.stderr)
+    return problem
+
+
+def plan(arguments):
+    """ Decide on the next action in a state of a problem, and print its name. """
+    problem = _load(arguments)
+    from mcts import mcts
+    state = frozenset(arguments.state) if arguments.state is not None else frozenset(problem.init)
+    if problem.goal_reached(state) or not problem.applicable_actions(state):
+        print("no action to take in " + ", ".join(sorted(state)), file=sys.stderr)
+        return 1
+    action = mcts(state, problem, _budget(arguments), arguments.horizon, **_search_options(arguments, problem))
+    print(action.name)
+    return 0
+
+
+def evaluate(arguments):
+    """ Run a number of episodes from the initial state of a problem, and report the rewards obtained. """
+    problem = _load(arguments)
+    from mcts import mcts
+    options = _search_options(arguments, problem)
+    rewards, goals, steps = [], 0, 0
+    started = perf_counter()
+    for _ in range(arguments.episodes):
+        state, reward = frozenset(problem.init), 0
+        for _ in range(arguments.max_steps):
+            if problem.goal_reached(state) or not problem.applicable_actions(state):
+                break
+            action = mcts(state, problem, _budget(arguments), arguments.horizon, **options)
+            effect = action.outcome()
+            reward += effect.reward
+            state = problem.successor(state, effect)
+            steps += 1
+        if problem.goal_reached(state):
+            reward += problem.goal_reward
+            goals += 1
+        rewards.append(reward)
+    elapsed = perf_counter() - started
+    print("episodes: " + str(arguments.episodes) + ", goals reached: " + str(goals) +
+          ", average reward: %0.3f" % (sum(rewards) / len(rewards)) +
+          ", average steps: %0.1f" % (steps / arguments.episodes) +
+          ", seconds per decision: %0.4f" % (elapsed / max(steps, 1)))
+    return 0
+
+
+def compile_problem(arguments):
+    """ Parse a PPDDL problem, and save it as a compiled problem file. """
+    problem = _load(arguments)
+    save_compiled(problem, arguments.output)
+    print("saved the compiled problem " + problem.name + " in " + arguments.output)
+    return 0
+
+
+def bench(arguments):
+    """ Measure the time to load a problem, and the number of iterations per second of searches in it. """
+    problem = _load(arguments)
+    from budget import iteration_budget
+    from mcts import mcts
+    started = perf_counter()
+    for _ in range(arguments.repeat):
+        load_problem(arguments.problem)
+    print("loading took %0.4f seconds on average" % ((perf_counter() - started) / arguments.repeat))
+    options = _search_options(arguments, problem)
+    iterations = arguments.iterations if arguments.iterations is not None else 1000
+    started = perf_counter()
+    for _ in range(arguments.repeat):
+        mcts(problem.init, problem, iteration_budget(iterations), arguments.horizon, **options)
+    elapsed = perf_counter() - started
+    print("searching took %0.4f seconds on average, or %0.0f iterations per second" %
+          (elapsed / arguments.repeat, iterations * arguments.repeat / elapsed))
+    return 0
+
+
+def _positive(value):
+    """ Convert a command-line argument into a positive integer.
+    :raises: an ArgumentTypeError if the argument is not a positive integer """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number <= 0:
+        raise argparse.ArgumentTypeError("expected a positive integer, got " + repr(value))
+    return number
+
+
+def _parser():
+    """ Create the parser of the command-line arguments. """
+    parser = argparse.ArgumentParser(prog="sparsepy", description="Plan in PPDDL problems with sparse-UCT MCTS.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name, function, help_text, search=True):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("problem", help="the PPDDL problem description or compiled problem file")
+        subparser.set_defaults(function=function)
+        if search:
+            budget = subparser.add_mutually_exclusive_group()
+            budget.add_argument("--iterations", type=_positive, default=None, help="number of iterations per search")
+            budget.add_argument("--seconds", type=float, default=0.05, help="number of seconds per search")
+            subparser.add_argument("--horizon", type=int, default=50, help="maximum depth of the search")
+            subparser.add_argument("--discounting", type=float, default=0.9, help="discounting factor")
+            subparser.add_argument("--exploration", type=float, default=2 ** -0.5, help="UCB1 exploration constant")
+            subparser.add_argument("--greedy-rollouts", action="store_true",
+                                   help="follow the FF heuristic during rollouts rather than random actions")
+        return subparser
+
+    add_command("plan", plan, "decide on the next action").add_argument(
+        "--state", nargs="*", default=None, help="the atoms which are true; defaults to the initial state")
+    evaluate_parser = add_command("evaluate", evaluate, "run episodes and report the rewards")
+    evaluate_parser.add_argument("--episodes", type=_positive, default=10, help="number of episodes")
+    evaluate_parser.add_argument("--max-steps", type=_positive, default=100, help="maximum number of steps per episode")
+    compile_parser = add_command("compile", compile_problem, "save a problem as a compiled problem file", False)
+    compile_parser.add_argument("output", help="the location of the compiled problem file")
+    compile_parser.add_argument("--simplify", action="store_true", help="simplify the problem before saving it")
+    add_command("bench", bench, "measure loading and search speed").add_argument(
+        "--repeat", type=_positive, default=5, help="number of times to repeat each measurement")
+    return parser
+
+
+def main(argv=None):
+    """ Run the command-line interface.
+    :param argv: the command-line arguments; defaults to those of the process
+    :return: the exit status """
+    arguments = _parser().parse_args(argv)
+    return arguments.function(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 from vose import Vose
+from fractions import Fraction
 import textwrap
 
 
@@ -16,6 +17,39 @@ class Problem:
         :return: True if the state satisfies one of the goals defined for this problem; False otherwise """
         return any(subgoal[1] <= state and not(subgoal[0] & state) for subgoal in self.goals)
 
+    def applicable_actions(self, state):
+        """ Determine the actions for which a given state agrees with at least one of their preconditions.
+        :param state: the state to verify, as the set of atoms which are true
+        :return: a list of the actions applicable in the state """
+        return [action for action in self.actions if
+                any(pos <= state and not (neg & state) for neg, pos in action.preconditions)]
+
+    def successor(self, state, effect):
+        """ Determine the state resulting from an effect occurring in a given state.
+        :param state: the state in which the effect occurs, as the set of atoms which are true
+        :param effect: the effect that occurs
+        :return: the resulting state """
+        return state - effect.delete | effect.add
+
+    def atoms(self):
+        """ Collect all the atoms that occur in this problem, be it in the initial state, goals, or actions.
+        :return: the set of all atoms in this problem """
+        atoms = set(self.init)
+        for neg, pos in self.goals:
+            atoms |= neg | pos
+        for action in self.actions:
+            for neg, pos in action.preconditions:
+                atoms |= neg | pos
+            for effect in action.effects:
+                atoms |= effect.delete | effect.add
+        return atoms
+
+    def compile(self):
+        """ Validate the probability distributions of all actions exactly, and prepare their float probabilities
+            and alias tables for use at runtime, see Action.compile. """
+        for action in self.actions:
+            action.compile()
+
     def __str__(self):
         output = "Problem description of " + self.name + ":"
         output += "\n init conditions:\n"
@@ -38,8 +72,20 @@ class Problem:
         return output
 
 
+def exact(value):
+    """ Convert a probability into an exact rational number. Floats are converted through their shortest decimal
+        representation, so that e.g. 0.1 becomes 1/10 rather than the nearest binary fraction.
+    :param value: the probability, as a Fraction, an integer, or a float
+    :return: the probability as a Fraction """
+    if isinstance(value, float):
+        return Fraction(str(value))
+    return Fraction(value)
+
+
 class Effect:
     """ Provide a way to define effects, including their delete and add sets, as well as their probability of occurring.
+        The probability is kept both exactly, as a Fraction for validation and reporting, and as a float for use at
+        runtime, where float arithmetic is much faster.
     """
     def __init__(self, delete, add, probability, reward=0):
         self.delete = delete
@@ -78,22 +124,31 @@ class Effect:
     @property
     def probability(self):
         """ Getter for probability.
-        :return: the probability of this effect.
+        :return: the probability of this effect, as a float.
         """
         return self._probability
 
     @probability.setter
     def probability(self, value):
         """ Setter for probability, verifying that the value is greater or equal than 0 and smaller or equal to 1
-        :param value: the value to change the probability into
+        :param value: the value to change the probability into; a Fraction, an integer, or a float
         """
-        if 0 < value > 1:
+        exact_value = exact(value)
+        if not 0 <= exact_value <= 1:
             raise AttributeError("The value should be between 0 and 1 (inclusive).")
         else:
-            self._probability = value
+            self._exact_probability = exact_value
+            self._probability = float(exact_value)
+
+    @property
+    def exact_probability(self):
+        """ Getter for the exact probability.
+        :return: the probability of this effect, as a Fraction.
+        """
+        return self._exact_probability
 
     def __repr__(self):
-        return "Effect(" + str(self.delete) + ", " + str(self.add) + ", " + str(self.probability) + ")"
+        return "Effect(" + str(self.delete) + ", " + str(self.add) + ", " + str(self.exact_probability) + ")"
 
     def __str__(self):
         atoms = []
@@ -117,20 +172,26 @@ class Action:
         self.name = name
         self.preconditions = [(set(), set())] if not preconditions else preconditions  # multiple conditions may apply
         self.effects = [] if effects is None else effects
-        total_probability = sum([effect.probability for effect in effects])
+        self.compile()
+
+    def compile(self):
+        """ Validate the probability distribution of the effects exactly, adding the default effect where nothing
+            changes if needed, and prepare the float probabilities and the alias table used at runtime. """
+        total_probability = sum([effect.exact_probability for effect in self.effects])
         if total_probability > 1:  # test whether the total probability does not exceed 1
             raise AttributeError("The probability of the effects of an action must sum up to 1 or less than 1.")
         elif total_probability < 1:  # if the probability is less than 1, add the default effect where nothing changes
             self.effects.append(Effect(set(), set(), 1 - total_probability))
 
         # sort the effects so that the most likely effect is on top; use for efficient rollouts along most probable path
-        self.effects = sorted(self.effects, key=lambda effect: effect.probability, reverse=True)
-        self._vose = Vose([(effect.probability, effect) for effect in self.effects])
+        self.effects = sorted(self.effects, key=lambda effect: effect.exact_probability, reverse=True)
+        self._vose = Vose([(effect.probability, effect) for effect in self.effects])  # built from the floats
 
-    def outcome(self):
+    def outcome(self, generator=None):
         """ Determine one of the effects of this action, according to the underlying probability distribution.
+            :param generator: the random.Random instance to draw the effect with; defaults to the shared generator
             :return: one of the effects of the action. """
-        return self._vose.random()
+        return self._vose.random(generator)
 
     def __repr__(self):
         return "Action(" + self.name + ", " + str(self.preconditions) + ", " + str(self.effects) + ")"
@@ -0,0 +1,164 @@
+"""
+This module exports search trees, either as a Graphviz DOT file, as a compact JSON-lines dump of node statistics,
+ or as NumPy arrays of node statistics in a struct-of-arrays layout.
+
+The search tree is traversed iteratively, and the output is written node by node as it is traversed, so that even
+ large and deep trees can be exported without building the whole document in memory or hitting the recursion limit.
+ The export can be bounded by a maximum depth, a minimum number of visits, and by only following the top-k most
+ visited tried actions of each node. Only actions that were actually tried are exported, not simulated ones.
+"""
+import json
+import os
+from array import array
+
+__author__ = "Kim Bauters"
+
+
+def walk_tree(root, max_depth=None, min_visits=0, top_k=None):
+    """ Traverse a search tree depth-first, without recursion, subject to the given bounds.
+    :param root: the root node of the (part of the) search tree to traverse
+    :param max_depth: the maximum depth of the nodes to visit, with the root at depth 0; by default, no maximum
+    :param min_visits: the minimum number of visits of a tried action, and of a node, to follow it
+    :param top_k: the maximum number of tried actions to follow in each node, preferring the most visited ones;
+                  by default, all tried actions are followed
+    :return: a generator of tuples (node id, parent id, slot, depth, node, actions), in which the parent id is -1
+             for the root, the slot is the index of the action leading to the node in the actions of the parent,
+             and the actions are the tried actions followed in the node, as triples (action, utility, visits) """
+    next_id = 0
+    stack = [(root, -1, -1, 0)]
+    while stack:
+        node, parent_id, slot, depth = stack.pop()
+        node_id = next_id
+        next_id += 1
+        actions = [(action, utility, visits) for action, (utility, visits) in node.tried_actions.items()
+                   if visits >= min_visits]
+        if top_k is not None:
+            actions = sorted(actions, key=lambda info: info[2], reverse=True)[:top_k]
+        yield node_id, parent_id, slot, depth, node, actions
+        if max_depth is not None and depth >= max_depth:
+            continue
+        slots = {action: index for index, (action, _, _) in enumerate(actions)}
+        children = [(child, slots[action]) for (action, _), child in node.children.items()
+                    if action in slots and child.visits >= min_visits]
+        for child, child_slot in reversed(children):  # reversed, so that the children are visited in order
+            stack.append((child, node_id, child_slot, depth + 1))
+
+
+def write_graphviz(root, file, max_depth=None, min_visits=0, top_k=None):
+    """ Write a search tree as a Graphviz DOT document, streaming it node by node.
+    :param root: the root node of the (part of the) search tree to write
+    :param file: the text file to write to
+    :param max_depth: the maximum depth of the nodes to write, see walk_tree
+    :param min_visits: the minimum number of visits of the actions and nodes to write, see walk_tree
+    :param top_k: the maximum number of tried actions to write for each node, see walk_tree
+    :return: the number of decision nodes written """
+    file.write("graph sparsepy {\n")
+    nodes = 0
+    for node_id, parent_id, slot, _, node, actions in walk_tree(root, max_depth, min_visits, top_k):
+        name = "decision_node" + str(node_id)
+        file.write("  " + name + ' [label="' + ', '.join(node.state) + '\n' +
+                   '%0.2f' % node.utility + ',' + str(node.visits) + '"]\n')
+        if parent_id >= 0:  # connect the node to the action in its parent that led to it
+            file.write("  action_node" + str(parent_id) + "_" + str(slot) + " -- " + name +
+                       ' [style=dashed, label="' + str(node.effect) + '"]\n')
+        for index, (action, reward, visits) in enumerate(actions):
+            action_name = "action_node" + str(node_id) + "_" + str(index)
+            file.write("  " + action_name + ' [label="' + action.name + '", shape=box]\n')
+            file.write("  " + name + " -- " + action_name + ' [label="' + '%0.2f' % reward + ',' + str(visits) +
+                       '", penwidth="' + str(visits**(1/4)) + '"]\n')
+        nodes += 1
+    file.write("}")
+    return nodes
+
+
+def write_json_lines(root, file, max_depth=None, min_visits=0, top_k=None):
+    """ Write the statistics of the nodes of a search tree as JSON objects, one per line, streaming them node by node.
+        Each object holds the id of the node and of its parent, its depth, the names of the action and the effect
+        leading to it, its state, visits and utility, and the utility and visits of each of its tried actions.
+    :param root: the root node of the (part of the) search tree to write
+    :param file: the text file to write to
+    :param max_depth: the maximum depth of the nodes to write, see walk_tree
+    :param min_visits: the minimum number of visits of the actions and nodes to write, see walk_tree
+    :param top_k: the maximum number of tried actions to write for each node, see walk_tree
+    :return: the number of nodes written """
+    nodes = 0
+    for node_id, parent_id, _, depth, node, actions in walk_tree(root, max_depth, min_visits, top_k):
+        record = {"id": node_id, "parent": parent_id, "depth": depth,
+                  "action": None if parent_id < 0 else node.action.name,
+                  "effect": None if parent_id < 0 else str(node.effect),
+                  "state": sorted(node.state), "visits": node.visits, "utility": node.utility,
+                  "actions": {action.name: [utility, visits] for action, utility, visits in actions}}
+        file.write(json.dumps(record) + "\n")
+        nodes += 1
+    return nodes
+
+
+# the columns of the arrays produced by tree_arrays, with their array type codes and NumPy data types
+COLUMNS = (("node_id", "q", "int64"), ("parent_id", "q", "int64"), ("depth", "q", "int64"),
+           ("action_index", "q", "int64"), ("effect_index", "q", "int64"), ("visits", "q", "int64"),
+           ("utility", "d", "float64"), ("goal", "b", "bool"))
+
+
+def tree_arrays(root, max_depth=None, min_visits=0, top_k=None):
+    """ Collect the statistics of the nodes of a search tree as NumPy arrays, one per column, in which the entries
+        at the same position belong to the same node. The columns are the id of the node and of its parent (-1 for
+        the root), its depth (0 for the root), the index of the action (in the problem) and of the effect (in the
+        action) leading to it (-1 for the root), its visits and utility, and whether it is a goal. The columns are
+        filled as typed buffers while traversing the tree with walk_tree, so that the nodes are numbered in the same
+        order, and turned into arrays without copying them.
+    :param root: the root node of the (part of the) search tree to export
+    :param max_depth: the maximum depth of the nodes to export, see walk_tree
+    :param min_visits: the minimum number of visits of the actions and nodes to export, see walk_tree
+    :param top_k: the maximum number of tried actions to follow for each node, see walk_tree
+    :return: a dictionary mapping the name of each column to its array """
+    import numpy as np  # only needed for this export, so numpy is only required when using it
+    actions = {action: index for index, action in enumerate(root.problem.actions)}
+    effects = {id(effect): index for action in root.problem.actions for index, effect in enumerate(action.effects)}
+    buffers = [array(code) for _, code, _ in COLUMNS]
+    node_ids, parent_ids, depths, action_indices, effect_indices, visits, utilities, goals = buffers
+    for node_id, parent_id, _, depth, node, _ in walk_tree(root, max_depth, min_visits, top_k):
+        node_ids.append(node_id)
+        parent_ids.append(parent_id)
+        depths.append(depth)
+        if parent_id < 0:
+            action_indices.append(-1)
+            effect_indices.append(-1)
+        else:
+            action_indices.append(actions[node.action])
+            effect_indices.append(effects[id(node.effect)])
+        visits.append(node.visits)
+        utilities.append(node.utility)
+        goals.append(bool(node.is_goal))
+    return {name: np.frombuffer(buffer, dtype=dtype) if len(buffer) else np.zeros(0, dtype=dtype)
+            for (name, _, dtype), buffer in zip(COLUMNS, buffers)}
+
+
+def save_tree_arrays(root, directory, **bounds):
+    """ Save the statistics of the nodes of a search tree as NumPy arrays, one .npy file per column.
+    :param root: the root node of the (part of the) search tree to export
+    :param directory: the directory in which to save the files; it is created if it does not exist yet
+    :param bounds: the named bounds max_depth, min_visits, and top_k, see walk_tree
+    :return: a dictionary mapping the name of each column to the location of its file """
+    import numpy as np
+    os.makedirs(directory, exist_ok=True)
+    locations = {}
+    for name, values in tree_arrays(root, **bounds).items():
+        locations[name] = os.path.join(directory, name + ".npy")
+        np.save(locations[name], values)
+    return locations
+
+
+def export_tree(root, location, kind="graphviz", **bounds):
+    """ Export a search tree to a file.
+    :param root: the root node of the (part of the) search tree to export
+    :param location: the location of the file to write; an existing file is overwritten
+    :param kind: either "graphviz" for a Graphviz DOT file, or "jsonl" for a JSON-lines dump
+    :param bounds: the named bounds max_depth, min_visits, and top_k, see walk_tree
+    :return: the location of the written file
+    :raises: a ValueError for an unknown format """
+    writers = {"graphviz": write_graphviz, "jsonl": write_json_lines}
+    if kind not in writers:
+        raise ValueError("unknown export format " + str(kind) + "; expected one of " + ", ".join(writers))
+    with open(location, "w") as file:
+        writers[kind](root, file, **bounds)
+    return location
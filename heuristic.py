@@ -0,0 +1,189 @@
+"""
+This module implements heuristics based on the delete relaxation of a problem, computed on bitset states.
+
+In the delete relaxation, atoms that are reached are never lost again. To handle negative preconditions and goals,
+ each atom is represented by two facts: one for the atom being true, and one for the atom being false.
+ A state then becomes a bitset (a Python int) of facts, and each effect of each action becomes a relaxed operator
+ which adds the facts for the atoms it adds (true) and deletes (false) once its precondition facts are reached.
+ Effects of all probabilities are considered, i.e. the relaxation is also an all-outcomes determinisation.
+"""
+from math import inf
+
+from cache import LRUCache
+
+__author__ = "Kim Bauters"
+
+
+def _bits(mask):
+    """ Determine the indices of the bits that are set in a bitset.
+    :param mask: the bitset, as an int
+    :return: a tuple with the indices of the set bits """
+    bits = []
+    while mask:
+        lowest = mask & -mask  # isolate the lowest set bit
+        bits.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return tuple(bits)
+
+
+class RelaxedPlanningGraph:
+    """ The delete relaxation of a problem, which can determine whether and how easily a goal can be reached. """
+    def __init__(self, problem, cache_size=100000):
+        """
+        :param problem: the problem to relax
+        :param cache_size: the number of states for which to memoise the heuristic value
+        """
+        self.problem = problem
+        atoms = sorted(problem.atoms())
+        self._true = {atom: 1 << (2 * index) for index, atom in enumerate(atoms)}  # the fact for an atom being true
+        self._false = {atom: 1 << (2 * index + 1) for index, atom in enumerate(atoms)}  # ... and for it being false
+        self._all_false = sum(self._false.values())
+
+        # the relaxed operators as (precondition, add) bitsets, along with the indices of their set bits
+        operators = set()
+        for action in problem.actions:
+            for neg, pos in action.preconditions:
+                precondition = self.conjunction(neg, pos)
+                for effect in action.effects:
+                    add = self.conjunction(effect.delete, effect.add)
+                    if effect.probability > 0 and add & ~precondition:  # skip operators that cannot add anything
+                        operators.add((precondition, add))
+        self.operators = [(precondition, add, _bits(precondition), _bits(add)) for precondition, add in operators]
+        self.goals = [self.conjunction(neg, pos) for neg, pos in problem.goals]
+        self._cache = LRUCache(cache_size)
+
+    def conjunction(self, negative, positive):
+        """ Convert a conjunction of negative and positive atoms into a bitset of facts.
+        :param negative: the atoms which should be false
+        :param positive: the atoms which should be true
+        :return: the bitset of facts representing the conjunction """
+        return sum(self._false[atom] for atom in negative) | sum(self._true[atom] for atom in positive)
+
+    def encode(self, state):
+        """ Convert a state into a bitset of facts.
+        :param state: the set of atoms which are true in the state
+        :return: the bitset of facts representing the state """
+        true = sum(self._true[atom] for atom in state if atom in self._true)
+        return true | (self._all_false ^ (true << 1))  # an atom is false if its fact for being true is not set
+
+    def __call__(self, state):
+        """ Evaluate a state using the heuristic, memoising the result.
+        :param state: the set of atoms which are true in the state
+        :return: the estimated number of steps to reach a goal, or inf if no goal can be reached """
+        key = frozenset(state)
+        value = self._cache.get(key)
+        if value is None:
+            value = self.evaluate(self.encode(state))
+            self._cache.put(key, value)
+        return value
+
+    def clear_cache(self):
+        """ Forget the memoised heuristic values, e.g. so that earlier evaluations do not affect later timings. """
+        self._cache.clear()
+
+    def reachable(self, state):
+        """ Verify whether a goal can be reached from a state in the delete relaxation. If not, no goal can be
+            reached from the state at all, i.e. the state is a dead end.
+        :param state: the set of atoms which are true in the state
+        :return: True if a goal can be reached in the delete relaxation; False otherwise """
+        return self(state) != inf
+
+    def evaluate(self, facts):
+        """ Evaluate a bitset of facts; the default implementation is h_max, i.e. the number of layers
+            of the relaxed planning graph needed before a goal is reached.
+        :param facts: the bitset of facts to evaluate
+        :return: the estimated number of steps to reach a goal, or inf if no goal can be reached """
+        layer = 0
+        while not any(goal & facts == goal for goal in self.goals):
+            reached = facts
+            for precondition, add, _, _ in self.operators:
+                if precondition & facts == precondition:
+                    reached |= add
+            if reached == facts:  # a fixpoint is reached without satisfying any goal
+                return inf
+            facts = reached
+            layer += 1
+        return layer
+
+
+class HAdd(RelaxedPlanningGraph):
+    """ The additive heuristic h_add, which sums the cost of reaching each of the facts of a goal separately. """
+    def evaluate(self, facts):
+        cost = {}  # the cost of reaching each of the facts that are not in the state
+        changed = True
+        while changed:  # keep propagating cheaper costs until a fixpoint is reached
+            changed = False
+            for _, _, precondition_bits, add_bits in self.operators:
+                operator_cost = 1
+                for bit in precondition_bits:
+                    if not (facts >> bit) & 1:
+                        if bit not in cost:
+                            break
+                        operator_cost += cost[bit]
+                else:  # all the preconditions are reachable, so the operator is applicable
+                    for bit in add_bits:
+                        if not (facts >> bit) & 1 and cost.get(bit, inf) > operator_cost:
+                            cost[bit] = operator_cost
+                            changed = True
+
+        best = inf
+        for goal in self.goals:
+            goal_cost = 0
+            for bit in _bits(goal & ~facts):
+                goal_cost += cost.get(bit, inf)
+            best = min(best, goal_cost)
+        return best
+
+
+class HFF(RelaxedPlanningGraph):
+    """ The FF heuristic h_FF, which counts the operators in a relaxed plan extracted from the relaxed planning graph.
+    """
+    def evaluate(self, facts):
+        initial = facts
+        achievers = {}  # for each fact not in the state, the first operator that reached it
+        goal = None
+        while goal is None:
+            for candidate in self.goals:
+                if candidate & facts == candidate:
+                    goal = candidate
+                    break
+            else:  # no goal is reached yet, so build the next layer of the relaxed planning graph
+                reached = facts
+                for index, (precondition, add, _, _) in enumerate(self.operators):
+                    if precondition & facts == precondition and add & ~reached:
+                        for bit in _bits(add & ~reached):
+                            achievers[bit] = index
+                        reached |= add
+                if reached == facts:  # a fixpoint is reached without satisfying any goal
+                    return inf
+                facts = reached
+
+        # extract a relaxed plan by working backwards from the goal facts to the facts in the state
+        plan = set()
+        agenda = list(_bits(goal & ~initial))
+        while agenda:
+            index = achievers[agenda.pop()]
+            if index not in plan:
+                plan.add(index)
+                agenda.extend(_bits(self.operators[index][0] & ~initial))
+        return len(plan)
+
+
+class DeadEndDetector:
+    """ Detect dead ends, i.e. states from which no goal can be reached, using the delete relaxation of a problem.
+        If no goal can be reached from a state even in the delete relaxation, the state is certainly a dead end;
+        the converse does not hold, so some dead ends may go undetected. Results are cached per state. """
+    def __init__(self, problem, penalty=0, cache_size=100000):
+        """
+        :param problem: the problem in which to detect dead ends
+        :param penalty: the (discounted) reward to assign to the future of a dead end, e.g. a negative value
+        :param cache_size: the number of states for which to cache the result
+        """
+        self.penalty = penalty
+        self._graph = RelaxedPlanningGraph(problem, cache_size)
+
+    def __call__(self, state):
+        """ Verify whether a state is a dead end.
+        :param state: the set of atoms which are true in the state
+        :return: True if no goal can be reached from the state; False if a goal may be reachable """
+        return not self._graph.reachable(state)
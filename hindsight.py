@@ -0,0 +1,139 @@
+"""
+This module implements hindsight optimisation, an alternative to mcts() for selecting the next action.
+
+Hindsight optimisation samples a number of determinised futures, in which the outcome of each action at each step
+ is drawn up front from its probability distribution. Each such future is a deterministic problem, which is solved
+ exactly (up to the horizon) by a breadth-first expansion over bitset states followed by backward induction.
+ The value of each applicable action in the root is then averaged over all the sampled futures, and the action
+ with the best average value is selected. As each future is solved optimally, actions that only rarely lead to a
+ goal are still recognised, whereas random rollouts would hardly ever find them.
+ To bound the effort per future, at most max_layer states are expanded per step; any further states reached in a
+ step are not expanded, and are valued as if no reward can be obtained from them anymore.
+"""
+import random
+from multiprocessing import Pool
+
+from vose import Vose
+
+__author__ = "Kim Bauters"
+
+
+class _BitsetProblem:
+    """ A compact version of a problem in which states, conditions and effects are bitsets over the atoms. """
+    def __init__(self, problem):
+        atoms = sorted(problem.atoms())
+        self.bits = {atom: 1 << index for index, atom in enumerate(atoms)}
+        self.goal_reward = problem.goal_reward
+        self.goals = [(self.encode(pos), self.encode(neg)) for neg, pos in problem.goals]
+        # each action as a list of its preconditions, a list of its effects, and an alias table over its effects
+        self.actions = []
+        for action in problem.actions:
+            preconditions = [(self.encode(pos), self.encode(neg)) for neg, pos in action.preconditions]
+            effects = [(self.encode(effect.delete), self.encode(effect.add), effect.reward)
+                       for effect in action.effects]
+            outcomes = Vose([(effect.probability, index) for index, effect in enumerate(action.effects)])
+            self.actions.append((preconditions, effects, outcomes))
+
+    def encode(self, atoms):
+        """ Convert a set of atoms into a bitset. """
+        return sum(self.bits[atom] for atom in atoms if atom in self.bits)
+
+    def is_goal(self, state):
+        """ Verify whether a bitset state satisfies at least one of the goals. """
+        return any(pos & state == pos and not neg & state for pos, neg in self.goals)
+
+    def applicable(self, state):
+        """ Determine the indices of the actions applicable in a bitset state. """
+        return [index for index, (preconditions, _, _) in enumerate(self.actions)
+                if any(pos & state == pos and not neg & state for pos, neg in preconditions)]
+
+
+def _solve_future(arguments):
+    """ Sample a single determinised future, and solve it exactly by expanding it breadth-first up to the horizon,
+        followed by backward induction over the expanded layers.
+    :param arguments: a tuple of the bitset problem, the root state, the horizon, the discounting, the maximum number
+                      of states to expand per layer, and the seed for sampling the future; states beyond the maximum
+                      are not expanded, and have a value of 0
+    :return: a dictionary mapping the index of each action applicable in the root to its value in this future """
+    problem, root, horizon, discounting, max_layer, seed = arguments
+    generator = random.Random(seed)  # a generator of its own, so the shared generator is left alone
+    # draw the outcome of every action at every step up front
+    future = [[outcomes.random(generator) for _, _, outcomes in problem.actions] for _ in range(horizon)]
+
+    # expand the layers breadth-first; each layer maps a state to its transitions as (action, next state, reward)
+    layers = [{root: None}]
+    for step in range(horizon):
+        next_layer = {}
+        for state in layers[step]:
+            transitions = []
+            for index in problem.applicable(state):
+                delete, add, reward = problem.actions[index][1][future[step][index]]
+                next_state = state & ~delete | add
+                if problem.is_goal(next_state):
+                    reward += problem.goal_reward  # goal states are terminal, so they are not expanded
+                elif step + 1 < horizon and (next_state in next_layer or len(next_layer) < max_layer):
+                    next_layer[next_state] = None
+                transitions.append((index, next_state, reward))
+            layers[step][state] = transitions
+        if not next_layer:
+            break
+        layers.append(next_layer)
+
+    # compute the values backwards, from the last layer to the root
+    values = {}  # the values of the states in the layer after the current one
+    for step in range(len(layers) - 1, -1, -1):
+        layer_values = {}
+        for state, transitions in layers[step].items():
+            best = 0  # states without transitions have no future
+            for index, (_, next_state, reward) in enumerate(transitions or ()):
+                value = reward + discounting * values.get(next_state, 0)
+                best = value if index == 0 or value > best else best
+            layer_values[state] = best
+            if step == 0:  # in the root, keep the value of each of the actions
+                return {index: reward + discounting * values.get(next_state, 0)
+                        for index, next_state, reward in transitions}
+        values = layer_values
+    return {}
+
+
+def hindsight_values(root_state, problem, samples=16, horizon=50, *, discounting=0.9, workers=None,
+                     max_layer=10000, seed=None):
+    """ Estimate the value of each action applicable in a state by hindsight optimisation.
+    :param root_state: the state in which to evaluate the actions
+    :param problem: a description of the problem in the form of a Problem instance data structure
+    :param samples: the number of determinised futures to sample and solve
+    :param horizon: the number of steps to consider in each future
+    :param discounting: can only be given as named parameter; the discounting factor, as used by mcts()
+    :param workers: can only be given as named parameter; the number of processes to solve the futures in parallel;
+                    by default, the futures are solved one after the other in this process
+    :param max_layer: can only be given as named parameter; the maximum number of states to expand per step;
+                      the states reached beyond this number are valued at 0, i.e. as if they have no future
+    :param seed: can only be given as named parameter; a seed to sample reproducible futures
+    :return: a dictionary mapping each applicable action to its average value over the sampled futures """
+    bitset_problem = _BitsetProblem(problem)
+    seeds = random.Random(seed).sample(range(2 ** 32), samples)
+    tasks = [(bitset_problem, bitset_problem.encode(root_state), horizon, discounting, max_layer, task_seed)
+             for task_seed in seeds]
+    if workers:
+        with Pool(workers) as pool:
+            results = pool.map(_solve_future, tasks)
+    else:
+        results = [_solve_future(task) for task in tasks]
+
+    totals = {}
+    for result in results:
+        for index, value in result.items():
+            totals[index] = totals.get(index, 0) + value
+    return {problem.actions[index]: total / samples for index, total in totals.items()}
+
+
+def hindsight_optimisation(root_state, problem, samples=16, horizon=50, **options):
+    """ Select the next action to take by hindsight optimisation.
+    :param root_state: the state in which to select an action
+    :param problem: a description of the problem in the form of a Problem instance data structure
+    :param samples: the number of determinised futures to sample and solve
+    :param horizon: the number of steps to consider in each future
+    :param options: any further named arguments to pass on to hindsight_values
+    :return: the action with the best average value, or None if no action is applicable """
+    values = hindsight_values(root_state, problem, samples, horizon, **options)
+    return max(values, key=values.get, default=None)
@@ -19,7 +19,7 @@ Intuitively, PROST works by dividing the tree in layers, where one of the
 import logging as log
 from random import choice
 from collections import namedtuple
-from search_structure import Node
+from search_structure import Node, OpenLoopNode, ProgressiveWidening, RolloutNode, rollout
 
 __author__ = "Kim Bauters"
 
@@ -28,17 +28,34 @@ __author__ = "Kim Bauters"
 ActInfo = namedtuple('ActInfo', 'action reward visits')
 
 
+def best_average_reward(acts):
+    """ Select the action with the best average reward, which is the default way to select the best action.
+    :param acts: the ActInfo tuples of the tried actions
+    :return: the action with the best average reward """
+    return sorted(acts, key=lambda act: act.reward/act.visits, reverse=True)[0].action
+
+
+def most_visited(acts):
+    """ Select the most visited action, which is the robust way to select the best action; use this together with
+        budget.convergence_budget, which stops once the most visited action can no longer change.
+    :param acts: the ActInfo tuples of the tried actions
+    :return: the most visited action """
+    return max(acts, key=lambda act: act.visits).action
+
+
 def mcts(root_state, problem, budget, horizon,
          select_action=lambda node: choice(list(node.tried_actions.keys())),
          expand_action=lambda node: choice(node.untried_actions),
          rollout_action=lambda node: choice(node.untried_actions),
-         select_best=lambda acts: sorted(acts, key=lambda act: act.reward/act.visits, reverse=True)[0].action,
-         *, discounting=0.9, verbose=False, graphviz=False):
+         select_best=best_average_reward,
+         *, discounting=0.9, verbose=False, graphviz=False, root=None,
+         action_widening=None, outcome_widening=None, rollout_cache=None, rollout_depth=None, leaf_value=None,
+         open_loop=False, rave=False, dead_ends=None, statistics=None, value_store=None, profiler=None):
     """
     :param root_state: the initial state from which to start the search
     :param problem: a description of the problem in the form of a Problem instance data structure
-    :param budget: a function that is called after each cycle to determine
-                     whether we should stop (return False) or continue (return True)
+    :param budget: a function that is called after each cycle with the number of iterations so far and the root node
+                     to determine whether we should stop (return False) or continue (return True)
     :param horizon: the maximum depth up to which to explore the search tree
     :param select_action:  heuristic used to select an action during step 1 of each MCTS iteration
                            the function should select one argument, which is a list of actions we already tried
@@ -48,57 +65,161 @@ def mcts(root_state, problem, budget, horizon,
     :param discounting: can only be given as named parameter; alters the default discounting value
     :param verbose: can only be given as named parameter; provides (very) verbose output while searching
     :param graphviz: can only be given as named parameter; return the DOT graphviz contents associated with the search
+    :param root: can only be given as named parameter; an existing search tree rooted in a Node for root_state,
+                 which is extended in place rather than starting from an empty tree (e.g. to reuse earlier searches);
+                 for an open-loop search, the root should be an OpenLoopNode instead
+    :param action_widening: can only be given as named parameter; a ProgressiveWidening, or a pair (k, alpha),
+                            to only expand a new action in a node while it has fewer than k * n^alpha tried actions,
+                            with n the visits of the node, and to descend through the tried actions otherwise
+    :param outcome_widening: can only be given as named parameter; a ProgressiveWidening, or a pair (k, alpha),
+                             to only sample a new outcome of a tried action while it has fewer than k * n^alpha
+                             outcomes, with n the number of times the action was tried, and to reuse one otherwise
+    :param rollout_cache: can only be given as named parameter; a RolloutCache, shared across iterations and
+                          decisions, in which the return of the (most probable outcome) rollouts is memoised
+    :param rollout_depth: can only be given as named parameter; the maximum number of steps of a rollout,
+                          after which it is truncated even if the horizon is not reached yet
+    :param leaf_value: can only be given as named parameter; a function that estimates the discounted reward below
+                       the node in which a rollout ends without reaching a goal, e.g. policies.heuristic_leaf_value;
+                       it is called with the node and the discounting factor of the search
+    :param open_loop: can only be given as named parameter; whether to perform an open-loop search, in which the nodes
+                      of the search tree represent sequences of actions rather than states; the states are re-sampled
+                      in each iteration, so the tree grows with the number of tried actions rather than outcomes
+    :param rave: can only be given as named parameter; whether to keep all-moves-as-first (AMAF) statistics in the
+                 amaf dictionary of each node, crediting every action performed later in an iteration (including the
+                 rollout), for use by a RAVE heuristic such as policies.rave_select_action
+    :param dead_ends: can only be given as named parameter; a DeadEndDetector used to treat states from which no goal
+                      can be reached as terminal, without expanding them or performing rollouts from them, and with
+                      the penalty of the detector as the reward obtained below them
+    :param statistics: can only be given as named parameter; a SearchStatistics to which the number of iterations,
+                       the time spent, and the time spent by the garbage collector during the search are added
+    :param value_store: can only be given as named parameter; a ValueStore with which each new node is seeded, using
+                        the statistics accumulated over earlier searches as prior statistics of its actions
+    :param profiler: can only be given as named parameter; a profiling.Profiler which times the phases of each
+                     iteration as well as the calls to the heuristics and the budget
     :return: the next best action to take
     """
 
     log.basicConfig(format="%(levelname)s: %(message)s", level=log.DEBUG if verbose else log.ERROR)
-    root = Node(problem, None, None, None, root_state)  # each episode starts from the root node
+    root_state = frozenset(root_state)  # freeze the state so it can be hashed cheaply in caches
+    if root is None:  # unless an earlier search tree is reused, each episode starts from a new root node
+        root = OpenLoopNode(problem, None) if open_loop else Node(problem, None, None, None, root_state)
     iterations = 0  # so far, no iterations as we still have to start
-
-    while budget(iterations):  # continue exploring for as long as we have the computational budget
-
-        node = root  # the node to start from is the root node
-        depth = 1  # we are at the start, so a depth of 1
-
-        # (1) select: descend through the search tree to find a node to expand
-        log.info("Monte-Carlo Tree Search iteration starting from " + str(node.state))
-        log.info("  step (1): selecting node")
-
-        # find a node with untried actions by recursing through the children
-        while not node.untried_actions and node.children and depth <= horizon:
-            action = select_action(node)  # use heuristics to select the best action to follow
-            log.info("  -> " + action.name)
-            node = node.simulate_action(action)  # simulate the action to determine its stochastic outcome
-            depth += 1
-        # stop once we find a node with untried actions, or when the node does not have any children
-        log.info("  selected node with the state " + str(node.state))
-
-        # (2) expand: expand the node we just found
-        log.info("  step (2): expanding node on depth " + str(depth))
-        # check that the node we ended up with has actions we still have to try
-        if node.untried_actions and depth <= horizon and not node.is_goal:
-            action = expand_action(node)  # use heuristics to pick one of the actions to try
-            log.info("  -> " + action.name)
-            node = node.perform_action(action)  # execute this action; set the node to the generated child
-            log.info("  the new state became " + str(node.state))
-            depth += 1
-
-        # (3) rollout: simulate a full run from the expanded node
-        log.info("  step (3): performing rollout")
-        # perform a rollout from the current node; return final node, and total descend depth
-        node, depth = node.rollout_actions(rollout_action, depth, horizon)
-        log.info("  ended up in the state " + str(node.state))
-
-        # (4) backpropagate: update the search tree to reflect the results from the rollout
-        log.info("  step (4): backpropagating from depth " + str(depth) + " with " +
-                 ("success" if node.is_goal else "no success"))
-
-        node.update(discounting)  # perform the update of the values
-
-        iterations += 1
-
+    if action_widening is not None:
+        action_widening = ProgressiveWidening(*action_widening)
+    if outcome_widening is not None:
+        outcome_widening = ProgressiveWidening(*outcome_widening)
+
+    def expandable(candidate):
+        """ Verify whether a node has untried actions which we are allowed to expand. """
+        return candidate.untried_actions and (action_widening is None or
+                                              action_widening.allows(len(candidate.tried_actions), candidate.visits))
+
+    def dead_end(candidate):
+        """ Verify whether a node is a (detected) dead end, from which no goal can be reached. """
+        return dead_ends is not None and not candidate.is_goal and dead_ends(candidate.state)
+
+    if profiler is not None:  # wrap the callbacks so that their calls are counted and timed
+        budget = profiler.wrap("budget", budget, top_level=True)
+        select_action = profiler.wrap("select_action", select_action)
+        expand_action = profiler.wrap("expand_action", expand_action)
+        rollout_action = profiler.wrap("rollout_action", rollout_action)
+        select_best = profiler.wrap("select_best", select_best, top_level=True)
+        if leaf_value is not None:
+            leaf_value = profiler.wrap("leaf_value", leaf_value)
+
+    if value_store is not None and not open_loop:  # warm-start the root from history, unless it is reused
+        value_store.seed(root, discounting)
+    if statistics is not None:
+        statistics.start()
+    try:  # stop keeping track of the search even if one of the heuristics raises an exception
+        while budget(iterations, root):  # continue exploring for as long as we have the computational budget
+
+            node = root  # the node to start from is the root node
+            depth = 1  # we are at the start, so a depth of 1
+            path = [root]  # keep track of the path of nodes visited, to backpropagate along it
+            if open_loop:  # in an open-loop search, also keep track of the rewards obtained in the nodes
+                root.sample(root_state)
+                rewards = [problem.goal_reward if root.is_goal else 0]
+
+            # (1) select: descend through the search tree to find a node to expand
+            if profiler is not None:
+                profiler.phase("select", depth)
+            log.info("Monte-Carlo Tree Search iteration starting from " + str(node.state))
+            log.info("  step (1): selecting node")
+
+            # find a node with untried actions by recursing through the children
+            while not expandable(node) and node.tried_actions and depth <= horizon and not node.is_goal:
+                action = select_action(node)  # use heuristics to select the best action to follow
+                log.info("  -> " + action.name)
+                # simulate the action to determine its stochastic outcome
+                if open_loop:
+                    node, reward = node.simulate_action(action)
+                    rewards.append(reward)
+                else:
+                    node = node.simulate_action(action, widening=outcome_widening)
+                path.append(node)
+                depth += 1
+                if profiler is not None:
+                    profiler.depth = depth
+            # stop once we find a node with untried actions we can expand, or when the node does not have tried actions
+            log.info("  selected node with the state " + str(node.state))
+
+            # (2) expand: expand the node we just found
+            if profiler is not None:
+                profiler.phase("expand", depth)
+            log.info("  step (2): expanding node on depth " + str(depth))
+            # check that the node we ended up with has actions we still have to try; the root is expanded even when it
+            # is a dead end, as an action has to be chosen in it regardless
+            if expandable(node) and depth <= horizon and not node.is_goal and (node is root or not dead_end(node)):
+                action = expand_action(node)  # use heuristics to pick one of the actions to try
+                log.info("  -> " + action.name)
+                if open_loop:  # execute this action; set the node to the generated child
+                    node, reward = node.simulate_action(action)
+                    rewards.append(reward)
+                else:
+                    node = node.perform_action(action)
+                path.append(node)
+                log.info("  the new state became " + str(node.state))
+                depth += 1
+
+            if value_store is not None and not open_loop and not node.visits:  # warm-start new nodes from history
+                value_store.seed(node, discounting)
+
+            # (3) rollout: simulate a full run from the expanded node
+            if profiler is not None:
+                profiler.phase("rollout", depth)
+            log.info("  step (3): performing rollout")
+            # perform a rollout from the current node; return the discounted reward, and total descend depth
+            rave_actions = [] if rave else None  # for RAVE, keep track of the actions performed during the rollout
+            if dead_end(node):  # a dead end is terminal, so skip the rollout and apply the penalty instead
+                value = dead_ends.penalty
+            else:
+                # rollout heuristics choose from the untried actions, which in a node with tried actions (e.g. one
+                # seeded from a value store, reached at the horizon, or under widening) are only some, if any, of
+                # its applicable actions; so roll out from a stand-in instead, which offers all applicable actions
+                start = RolloutNode(problem, node.state) if open_loop or node.tried_actions else node
+                value, depth = rollout(start, rollout_action, depth, horizon, discounting, rollout_cache,
+                                       rollout_depth, leaf_value, rave_actions, dead_ends, profiler)
+
+            # (4) backpropagate: update the search tree to reflect the results from the rollout
+            if profiler is not None:
+                profiler.phase("backup", len(path))
+            log.info("  step (4): backpropagating from depth " + str(depth) + " with a rollout reward of " + str(value))
+
+            if open_loop:  # perform the update of the values
+                OpenLoopNode.backup(path, rewards, discounting, value, rave_actions)
+            else:
+                Node.backup(path, discounting, value, rave_actions)
+
+            iterations += 1
+
+    finally:
+        if profiler is not None:
+            profiler.phase(None)
+        if statistics is not None:
+            statistics.stop(iterations)
     log.info("search completed\n")
-    if graphviz:
+    if graphviz and not open_loop:  # an open-loop search tree has no states to show
         location = root.create_graphviz()
         print("The Graphviz DOT file has been saved in " + str(location) + ".")
 
@@ -1,3 +1,4 @@
+import logging as log
 from data_structure import Action, Effect, Problem
 from grako.ast import AST
 from fractions import Fraction
@@ -44,9 +45,10 @@ class PDOParser(PPDDLsubParser):
         :return: the parsed AST """
         return super(PDOParser, self).parse(new_input, "start", semantics=self.PDOSemantics())
 
-    def process_input(self, new_input):
+    def process_input(self, new_input, simplify=False):
         """ The function will take an input and will parse it into a legal Problem class when the input is valid.
         :param new_input: the input to parse
+        :param simplify: whether to simplify the problem (see simplify.simplify_problem) before returning it
         :return: the parsed input as a Problem class """
         ast = self._parse_input(new_input)
 
@@ -148,4 +150,10 @@ class PDOParser(PPDDLsubParser):
         # the goal states, the reward for reaching any goal state, and the actions
         my_problem = Problem(ast.problem.problem_name, set(initial_state), goal_states, goal_reward, actions)
 
+        # optionally, simplify the problem and report on what was removed
+        if simplify:
+            from simplify import simplify_problem
+            my_problem, report = simplify_problem(my_problem)
+            log.info(str(report))
+
         return my_problem
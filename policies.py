@@ -0,0 +1,82 @@
+"""
+This module provides generator functions for commonly used heuristics that can be passed to mcts().
+"""
+import math
+from math import inf
+from random import choice, random
+
+__author__ = "Kim Bauters"
+
+
+# generator function to create a UCB1-based select_action heuristic with a given exploration constant
+def ucb1_select_action(exploration=1/math.sqrt(2)):
+
+    def inner_ucb1_select_action(node):
+        """ Select the action with the best UCB1 value, i.e. the best trade-off between
+            the average reward of an action and the number of times it has been explored. """
+        best_action = (None, 0)
+        log_visits = math.log(node.visits)
+        for action, (action_reward, visits) in node.tried_actions.items():
+            ucb1 = exploration * math.sqrt(log_visits/visits) + (action_reward/visits)
+            if not best_action[0] or ucb1 > best_action[1]:
+                best_action = (action, ucb1)
+        return best_action[0]
+    return inner_ucb1_select_action
+
+
+# generator function to create a rollout_action heuristic that greedily picks the action whose most probable outcome
+# has the best heuristic value, e.g. for a HAdd or HFF instance; with probability epsilon a random action is picked
+def greedy_rollout_action(heuristic, epsilon=0):
+
+    def inner_greedy_rollout_action(node):
+        """ Select the action whose most probable outcome is estimated to be closest to a goal. """
+        actions = node.untried_actions  # determined anew on each access for a RolloutNode, so only read it once
+        if epsilon and random() < epsilon:
+            return choice(actions)
+        best_actions, best_value = [], inf
+        for action in actions:
+            effect = action.effects[0]  # rollouts follow the most probable effect
+            value = heuristic(node.state - effect.delete | effect.add)
+            if value < best_value:
+                best_actions, best_value = [action], value
+            elif value == best_value:
+                best_actions.append(action)
+        return choice(best_actions if best_actions else actions)
+    return inner_greedy_rollout_action
+
+
+# generator function to create a function that estimates the discounted reward below the node in which a rollout ends,
+# assuming that a goal is reached in the number of steps estimated by the heuristic, e.g. by a HAdd or HFF instance;
+# the reward is discounted with the discounting factor of the search, which mcts() passes on
+def heuristic_leaf_value(heuristic):
+
+    def inner_heuristic_leaf_value(node, discounting):
+        """ Estimate the discounted goal reward that can still be obtained from the node. """
+        steps = heuristic(node.state)
+        if steps == inf:  # no goal can be reached from this node
+            return 0
+        return node.problem.goal_reward * discounting ** max(steps - 1, 0)
+    return inner_heuristic_leaf_value
+
+
+# generator function to create a RAVE-based select_action heuristic, which blends the average reward of each action
+# with its all-moves-as-first (AMAF) average reward, as kept by mcts() when called with rave=True; the weight of the
+# AMAF average decreases with the visits n of the node as sqrt(equivalence / (3n + equivalence))
+def rave_select_action(exploration=1/math.sqrt(2), equivalence=300):
+
+    def inner_rave_select_action(node):
+        """ Select the action with the best UCB1 value, based on the blend of its average and its AMAF reward. """
+        beta = math.sqrt(equivalence / (3 * node.visits + equivalence))
+        amaf = node.amaf or {}
+        best_action = (None, 0)
+        log_visits = math.log(node.visits)
+        for action, (action_reward, visits) in node.tried_actions.items():
+            value = action_reward / visits
+            if action in amaf:
+                amaf_reward, amaf_visits = amaf[action]
+                value = (1 - beta) * value + beta * amaf_reward / amaf_visits
+            ucb1 = exploration * math.sqrt(log_visits/visits) + value
+            if not best_action[0] or ucb1 > best_action[1]:
+                best_action = (action, ucb1)
+        return best_action[0]
+    return inner_rave_select_action
@@ -0,0 +1,120 @@
+"""
+This module extracts multi-step plans from a finished search tree, and provides a controller that follows them.
+
+Rather than only using the best action in the root, the whole search tree can be turned into a contingent policy,
+ mapping each well-visited state in the tree to the best action in it. A PolicyController follows such a policy
+ for a limited number of steps, as long as the observed states are covered by it, and searches again when the
+ observed state is off-policy, i.e. not in the tree, or when the node for it has not been visited often enough to
+ trust its best action. As the estimates deeper in the tree are less reliable, the policy can also be limited to the
+ nodes near the root of the search.
+"""
+from collections import namedtuple
+
+from mcts import ActInfo, best_average_reward, mcts
+from search_structure import Node
+
+__author__ = "Kim Bauters"
+
+
+# provide a named tuple for the steps of a principal variation
+Step = namedtuple('Step', 'state action visits')
+
+
+def _best_action(node, select_best):
+    """ Select the best action in a node, in the same way as mcts() does for the root. """
+    return select_best([ActInfo(action, reward, visits) for action, (reward, visits) in node.tried_actions.items()])
+
+
+def principal_variation(root, select_best=best_average_reward, min_visits=1):
+    """ Extract the principal variation from a search tree, i.e. the sequence of best actions when each action
+        results in its most visited outcome.
+    :param root: the root node of the search tree
+    :param select_best: the function to select the best action, given the ActInfo tuples of the tried actions
+    :param min_visits: the minimum number of visits of a node to extend the principal variation through it
+    :return: a list of Step tuples, each with a state, the best action in it, and the visits of its node """
+    steps = []
+    node = root
+    while node is not None and node.tried_actions and node.visits >= min_visits:
+        action = _best_action(node, select_best)
+        steps.append(Step(node.state, action, node.visits))
+        outcomes = [child for (child_action, _), child in node.children.items() if child_action is action]
+        node = max(outcomes, key=lambda child: child.visits, default=None)
+    return steps
+
+
+def extract_policy(root, select_best=best_average_reward, min_visits=10, max_depth=None):
+    """ Extract a contingent policy from a search tree, mapping each well-visited state in it to its best action.
+        When a state occurs in several nodes, the best action of the most visited of these nodes is used.
+    :param root: the root node of the search tree
+    :param select_best: the function to select the best action, given the ActInfo tuples of the tried actions
+    :param min_visits: the minimum number of visits of a node for its state to be part of the policy
+    :param max_depth: the maximum number of actions between the root and a node for its state to be part of the
+                      policy, or None to not limit the depth
+    :return: a dictionary mapping (frozen) states to a pair of the best action and the visits of the node """
+    policy = {}
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if node.visits < min_visits or not node.tried_actions:
+            continue  # the children of a node are never visited more often than the node itself
+        state = frozenset(node.state)
+        if state not in policy or policy[state][1] < node.visits:
+            policy[state] = (_best_action(node, select_best), node.visits)
+        if max_depth is None or depth < max_depth:
+            stack.extend((child, depth + 1) for (action, _), child in node.children.items()
+                         if action in node.tried_actions)
+    return policy
+
+
+class PolicyController:
+    """ Decide on actions by following the policy extracted from the latest search, and only search again when the
+        observed state is off-policy or too rarely visited in the search tree, or when the policy has been followed
+        for a number of steps already. """
+    def __init__(self, problem, budget, horizon, min_visits=10, select_best=best_average_reward, replan_after=3,
+                 max_depth=None, **search_options):
+        """
+        :param problem: the problem to act in
+        :param budget: a function without arguments that returns a new budget for each search, e.g.
+                       lambda: timed_budget(0.05)
+        :param horizon: the horizon of each search
+        :param min_visits: the minimum number of visits of a node in the search tree to follow its best action
+        :param select_best: the function to select the best action, given the ActInfo tuples of the tried actions
+        :param replan_after: the maximum number of steps to take by following the policy before searching again,
+                             or None to follow the policy for as long as it covers the observed states
+        :param max_depth: the maximum depth in the search tree of the nodes that are part of the policy,
+                          see extract_policy
+        :param search_options: any further (named) arguments to pass on to mcts(); an open-loop search is not
+                               supported, as its nodes do not represent states that a policy can be extracted for
+        :raises: a ValueError if an open-loop search is requested
+        """
+        if search_options.get("open_loop"):
+            raise ValueError("a policy can only be extracted from a closed-loop search tree")
+        self.problem = problem
+        self.budget = budget
+        self.horizon = horizon
+        self.min_visits = min_visits
+        self.select_best = select_best
+        self.replan_after = replan_after
+        self.max_depth = max_depth
+        self.search_options = search_options
+        self.policy = {}  # the policy extracted from the latest search
+        self.searches = 0  # the number of searches performed so far
+        self.decisions = 0  # the number of decisions made so far
+        self._followed = 0  # the number of steps taken by following the policy since the latest search
+
+    def act(self, state):
+        """ Decide on the action to perform in a state.
+        :param state: the observed state
+        :return: the action to perform """
+        self.decisions += 1
+        state = frozenset(state)
+        if state in self.policy and (self.replan_after is None or self._followed < self.replan_after):
+            self._followed += 1  # the state is on-policy, and the policy is still fresh, so follow the policy
+            return self.policy[state][0]
+        self.searches += 1  # otherwise, search again from the observed state ...
+        root = Node(self.problem, None, None, None, state)
+        action = mcts(state, self.problem, self.budget(), self.horizon, select_best=self.select_best,
+                      root=root, **self.search_options)
+        self.policy = extract_policy(root, self.select_best, self.min_visits, self.max_depth)  # ... and a new policy
+        self._followed = 0
+        return action
@@ -0,0 +1,41 @@
+"""
+This module loads problems from files, which are either PPDDL descriptions or compiled problem files.
+
+A compiled problem file holds a parsed (and possibly simplified) problem, so that it can be loaded without importing
+ the (Grako-based) parser at all, which makes short-lived processes start up much faster. Compiled problem files are
+ pickles, and loading a pickle can execute arbitrary code: only load compiled problem files from trusted locations.
+"""
+import pickle
+
+__author__ = "Kim Bauters"
+
+
+MAGIC = b"SPPC"  # identifies a compiled problem file
+VERSION = 2  # the version of the compiled problem file format
+
+
+def save_compiled(problem, location):
+    """ Save a problem as a compiled problem file.
+    :param problem: the problem to save
+    :param location: the location of the compiled problem file """
+    with open(location, "wb") as file:
+        file.write(MAGIC + bytes([VERSION]))
+        pickle.dump(problem, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_problem(location, simplify=False):
+    """ Load a problem from a file, which is either a compiled problem file or a PPDDL description; the parser is
+        only imported for the latter. As compiled problem files are unpickled, only load files from trusted locations.
+    :param location: the location of the problem file
+    :param simplify: whether to simplify a PPDDL problem (see simplify.simplify_problem) when parsing it
+    :return: the problem
+    :raises: a ValueError if the file is a compiled problem file of an unsupported version """
+    with open(location, "rb") as file:
+        header = file.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] == MAGIC:
+            if header[len(MAGIC):] != bytes([VERSION]):
+                raise ValueError("the compiled problem file " + str(location) + " has an unsupported version")
+            return pickle.load(file)
+        source = (header + file.read()).decode("utf-8")
+    from pdo_parser import PDOParser  # only pay for importing the parser when parsing
+    return PDOParser().process_input(source, simplify=simplify)
@@ -0,0 +1,134 @@
+"""
+This module implements an opt-in profiler for mcts(), to find out where the time of each iteration goes.
+
+Passed to mcts() as its profiler, a Profiler times the four phases of each iteration (select, expand, rollout and
+ backup), as well as every call to the heuristic callbacks (select_action, expand_action, rollout_action,
+ leaf_value, select_best and the budget), using a nanosecond clock and call counters. The time of a phase excludes
+ the time spent in the callbacks made during it, so the engine itself and the heuristics can be told apart.
+ For each phase and callback, the profiler keeps a histogram of the calls per depth, and a histogram of the
+ duration of the calls in power-of-two microsecond buckets. The results can be shown as a report, or written as
+ folded stacks, the input format of flame graph tools such as flamegraph.pl and speedscope.
+"""
+from time import perf_counter_ns
+
+__author__ = "Kim Bauters"
+
+
+class _Statistics:
+    """ The number of calls and the time taken by a phase or callback, in total, per depth, and per duration. """
+    __slots__ = ['calls', 'nanoseconds', 'depths', 'durations']
+
+    def __init__(self):
+        self.calls = 0  # the number of calls
+        self.nanoseconds = 0  # the total time taken by the calls
+        self.depths = {}  # the calls per depth, as depth -> [calls, nanoseconds]
+        self.durations = {}  # the calls per duration, as the bucket of calls taking less than 2^bucket microseconds
+
+    def add(self, elapsed, depth):
+        """ Add a call, taking a number of nanoseconds at a given depth. """
+        self.calls += 1
+        self.nanoseconds += elapsed
+        per_depth = self.depths.get(depth)
+        if per_depth is None:
+            self.depths[depth] = [1, elapsed]
+        else:
+            per_depth[0] += 1
+            per_depth[1] += elapsed
+        bucket = (elapsed // 1000).bit_length()
+        self.durations[bucket] = self.durations.get(bucket, 0) + 1
+
+
+class Profiler:
+    """ Collect the time spent in the phases of mcts() and in its callbacks. One profiler can be used for several
+        searches, in which case the results accumulate. """
+    def __init__(self):
+        self.phases = {}  # the statistics of each phase, excluding the callbacks made during it
+        self.callbacks = {}  # the statistics of each callback, key-ed by the phase it is called in and its name
+        self.depth = 0  # the depth of the node the search is at, as last reported by mcts()
+        self._phase = None  # the name of the current phase, if any
+        self._phase_started = 0  # the time at which the current phase started
+        self._nested = 0  # the time spent in callbacks during the current phase
+
+    def phase(self, name, depth=0):
+        """ End the current phase, if any, and start a new one.
+        :param name: the name of the new phase, or None to only end the current phase
+        :param depth: the depth at which the new phase starts; mcts() updates the depth as the phase proceeds """
+        now = perf_counter_ns()
+        if self._phase is not None:
+            statistics = self.phases.get(self._phase)
+            if statistics is None:
+                statistics = self.phases[self._phase] = _Statistics()
+            statistics.add(now - self._phase_started - self._nested, self.depth)  # the depth the phase reached
+        self._phase = name
+        self.depth = depth
+        self._nested = 0
+        self._phase_started = perf_counter_ns()
+
+    def wrap(self, name, function, top_level=False):
+        """ Wrap a callback so that its calls are counted and timed.
+        :param name: the name under which to report the callback
+        :param function: the callback to wrap
+        :param top_level: whether the callback is called outside of the phases, e.g. the budget; this ends the
+                          current phase, if any
+        :return: the wrapped callback """
+
+        def profiled(*arguments):
+            if top_level:
+                self.phase(None)
+            started = perf_counter_ns()
+            result = function(*arguments)
+            elapsed = perf_counter_ns() - started
+            self._nested += elapsed
+            key = (self._phase, name)
+            statistics = self.callbacks.get(key)
+            if statistics is None:
+                statistics = self.callbacks[key] = _Statistics()
+            statistics.add(elapsed, self.depth)
+            return result
+        return profiled
+
+    def _entries(self):
+        """ Collect the statistics of all the phases and callbacks, as pairs of their stack and statistics. """
+        entries = [(("mcts", name), statistics) for name, statistics in self.phases.items()]
+        entries += [(("mcts", phase, name) if phase else ("mcts", name), statistics)
+                    for (phase, name), statistics in self.callbacks.items()]
+        return sorted(entries, key=lambda entry: entry[1].nanoseconds, reverse=True)
+
+    def report(self, depths=True, durations=True):
+        """ Produce a report of the time spent in each phase and callback.
+        :param depths: whether to include the histogram of the calls per depth
+        :param durations: whether to include the histogram of the duration of the calls
+        :return: the report, as a string """
+        entries = self._entries()
+        total = sum(statistics.nanoseconds for _, statistics in entries) or 1
+        output = "Profile (time excludes nested callbacks):\n"
+        for stack, statistics in entries:
+            output += " %-30s %10d calls %10.3f ms %5.1f%% %8.2f us/call\n" % (
+                ";".join(stack[1:]), statistics.calls, statistics.nanoseconds / 1e6,
+                100 * statistics.nanoseconds / total, statistics.nanoseconds / statistics.calls / 1e3)
+            if depths:
+                output += "   per depth: " + ", ".join(
+                    str(depth) + ": " + str(calls) + " (%0.1f ms)" % (nanoseconds / 1e6)
+                    for depth, (calls, nanoseconds) in sorted(statistics.depths.items())) + "\n"
+            if durations:
+                output += "   durations: " + ", ".join(
+                    ("<" + str(2 ** bucket) + "us" if bucket else "<1us") + ": " + str(calls)
+                    for bucket, calls in sorted(statistics.durations.items())) + "\n"
+        return output
+
+    def __str__(self):
+        return self.report()
+
+    def folded(self):
+        """ Produce the profile as folded stacks, one line per phase or callback with its time in microseconds.
+        :return: the folded stacks, as a string """
+        return "".join(";".join(stack) + " " + str(statistics.nanoseconds // 1000) + "\n"
+                       for stack, statistics in self._entries())
+
+    def write_folded(self, location):
+        """ Write the profile as folded stacks to a file, e.g. for flamegraph.pl.
+        :param location: the location of the file to write
+        :return: the location of the written file """
+        with open(location, "w") as file:
+            file.write(self.folded())
+        return location
@@ -1,32 +1,177 @@
-import textwrap  # used for embellishing the Graphviz DOT file layout
+import weakref
+from collections import namedtuple
+from random import choices
+
+from export import export_tree
+
+
+class ProgressiveWidening(namedtuple('ProgressiveWidening', 'k alpha')):
+    """ Limit the number of children of a node to k * n^alpha, with n the number of visits so far. """
+    __slots__ = ()
+
+    def allows(self, children, visits):
+        """ Verify whether another child can be added.
+        :param children: the number of children so far
+        :param visits: the number of visits so far
+        :return: True if another child can be added; False otherwise """
+        return children < self.k * max(visits, 1) ** self.alpha or not children  # always allow a first child
+
+
+def rollout(start, rollout_action, depth, horizon, discounting=1, cache=None, max_steps=None, evaluate=None,
+            actions=None, dead_ends=None, profiler=None):
+    """ Organise a rollout from a given node to either a goal node or a leaf node (e.g. by hitting the horizon).
+       :param start: the node, or any object with a problem and a state, from which to start the rollout
+       :param rollout_action: the heuristic to select the action to use for the rollout
+       :param depth: the current depth at which the rollout is requested
+       :param horizon: the maximum depth to consider
+       :param discounting: the discounting factor to use for the rewards obtained during the rollout
+       :param cache: a RolloutCache to look up and store the return of rollouts from the states we pass through
+       :param max_steps: the maximum number of steps after which to truncate the rollout, if before the horizon
+       :param evaluate: a function to estimate the discounted reward obtainable below the node in which the rollout
+                        ends, if it is not a goal, e.g. to make up for truncating the rollout; it is called with the
+                        node and the discounting factor
+       :param actions: a list to which the actions performed during the rollout are appended, e.g. for RAVE
+       :param dead_ends: a DeadEndDetector, to end the rollout with its penalty as soon as a dead end is reached
+       :param profiler: a profiling.Profiler, whose depth is kept up to date as the rollout proceeds
+       :return: the discounted reward obtained below the start node, and the depth at which the rollout ended """
+    if max_steps is not None:
+        horizon = min(horizon, depth + max_steps)
+    problem = start.problem
+    node = start  # the rollout only passes through RolloutNodes, rather than adding nodes to the search tree
+    value = 0  # the discounted reward obtained after the last step of the rollout
+    steps = []  # the steps of the rollout so far, as (cache key, depth, reward obtained in the step)
+    while True:
+        if profiler is not None:  # attribute the calls of the callbacks to the depth the rollout is at
+            profiler.depth = depth
+        is_goal = node.is_goal
+        if is_goal or depth >= horizon:  # stop when we hit a goal state or the horizon
+            if evaluate is not None and not is_goal:
+                value = evaluate(node, discounting)
+            break
+        if dead_ends is not None and dead_ends(node.state):  # no goal can be reached, so stop with the penalty
+            value = dead_ends.penalty
+            break
+        key = None
+        if cache is not None:
+            key = (frozenset(node.state), horizon - depth)
+            cached = cache.get(key)
+            if cached is not None:  # the rest of the rollout is already known
+                value, length = cached
+                depth += length
+                break
+        action = rollout_action(node)  # use the heuristic to select the next action to perform
+        if actions is not None:
+            actions.append(action)
+        effect = action.effects[0]  # simulate the execution of this action by following its most probable effect
+        node = RolloutNode(problem, problem.successor(node.state, effect))
+        steps.append((key, depth, effect.reward + (problem.goal_reward if node.is_goal else 0)))
+        depth += 1
+    # discount the rewards from the end of the rollout backwards, and remember the return from each state
+    for key, step_depth, reward in reversed(steps):
+        value = reward + discounting * value
+        if key is not None:
+            cache.put(key, (value, depth - step_depth))
+    return value, depth
+
+
+def _update_amaf(node, actions, reward):
+    """ Credit a reward to the all-moves-as-first (AMAF) statistics of a node, as used by RAVE.
+    :param node: the node whose AMAF statistics to update
+    :param actions: the actions to credit, i.e. the distinct actions performed from the node onwards
+    :param reward: the discounted reward obtained from the node onwards """
+    if node.amaf is None:  # only allocate the AMAF statistics for nodes that use them
+        node.amaf = {}
+    for action in actions:
+        statistics = node.amaf.get(action)
+        if statistics is None:
+            node.amaf[action] = [reward, 1]
+        else:  # update the statistics in place
+            statistics[0] += reward
+            statistics[1] += 1
 
 
 class Node:
     # since we will be using a lot of Node instances, optimise the memory use by relying on slots rather than a dict
-    __slots__ = ['problem', 'parent', 'action', 'effect', 'state', 'is_goal', 'children',
-                 'visits', 'utility', 'untried_actions', 'tried_actions']
+    # the parent is only referenced weakly, so that the tree has no reference cycles and is released without the GC
+    __slots__ = ['problem', '_parent', 'action', 'effect', 'state', '_is_goal', 'children', 'outcomes',
+                 'visits', 'utility', '_untried_actions', 'tried_actions', 'amaf', '__weakref__']
 
     def __init__(self, problem, parent, action, effect, state):
         self.problem = problem  # the problem space in which this node is relevant
-        self.parent = parent  # parent node of this node
+        self.parent = parent  # parent node of this node; only kept as a weak reference
         self.action = action  # action that was used to get from the parent node to this node
         self.effect = effect  # effect of the action that resulted in the current node
         self.state = state  # the state of the world in this node
-        self.is_goal = problem.goal_reached(self.state)  # whether or not this node represents a goal state
+        self._is_goal = None  # whether or not this node represents a goal state; determined on first access
         self.children = dict()  # dictionary of children of this node, key-ed by the action and effect to get to them
+        self.outcomes = None  # dictionary linking each action to the list of its children; allocated on first child
         self.visits = 0  # number of times this node has been visited
         self.utility = 0  # cumulative utility from going through this node
-        # the available actions for which the current state agrees with their preconditions
-        self.untried_actions = [a for a in problem.actions if
-                                any(pos <= self.state and not (neg & self.state) for neg, pos in a.preconditions)]
+        self._untried_actions = None  # the applicable actions we did not try yet; determined on first access
         self.tried_actions = {}  # dictionary with the actions we tried so far as keys,
-        # and linked to a tuple consisting of their average reward and number of times we applied them: e.g.
-        # a1 -> (15, 2)
-        # a2 -> (10, 1)
+        # and linked to a list consisting of their total reward and number of times we applied them: e.g.
+        # a1 -> [15, 2]
+        # a2 -> [10, 1]
+        self.amaf = None  # dictionary with the same structure, for the all-moves-as-first statistics used by RAVE
+
+    @property
+    def parent(self):
+        """ Getter for the parent node of this node.
+        :return: the parent node, or None for a root node or when the parent no longer exists """
+        return self._parent() if self._parent is not None else None
+
+    @parent.setter
+    def parent(self, value):
+        self._parent = weakref.ref(value) if value is not None else None
 
-    def simulate_action(self, action, most_probable=False):
+    def add_child(self, child):
+        """ Add a child node, reached through its action and effect, to the children of this node.
+        :param child: the child node to add """
+        self.children[(child.action, child.effect)] = child
+        if self.outcomes is None:
+            self.outcomes = {}
+        self.outcomes.setdefault(child.action, []).append(child)
+
+    def detach(self):
+        """ Remove this node from the children of its parent, e.g. to continue a new search from its subtree. """
+        parent = self.parent
+        if parent is not None:
+            del parent.children[(self.action, self.effect)]
+            parent.outcomes[self.action].remove(self)
+        self.parent = None
+
+    @property
+    def is_goal(self):
+        """ Getter for whether or not this node represents a goal state, which is only verified when first needed.
+        :return: True if the state of this node satisfies one of the goals; False otherwise """
+        if self._is_goal is None:
+            self._is_goal = self.problem.goal_reached(self.state)
+        return self._is_goal
+
+    @property
+    def untried_actions(self):
+        """ Getter for the actions which are applicable in the state of this node, but which we did not try yet.
+            The applicable actions are only determined when first needed.
+        :return: the list of untried actions """
+        if self._untried_actions is None:
+            self._untried_actions = self.problem.applicable_actions(self.state)
+        return self._untried_actions
+
+    def restore(self, visits, utility, tried_actions):
+        """ Restore the statistics of this node, e.g. when loading a search tree from a checkpoint.
+        :param visits: the number of times this node has been visited
+        :param utility: the cumulative utility from going through this node
+        :param tried_actions: the tried actions, linked to their total reward and number of times we applied them """
+        self.visits = visits
+        self.utility = utility
+        self.tried_actions = {action: [reward, times] for action, (reward, times) in tried_actions.items()}
+        self._untried_actions = [action for action in self.problem.applicable_actions(self.state)
+                                 if action not in tried_actions] or ()
+
+    def simulate_action(self, action, most_probable=False, widening=None):
         """ Execute the rollout of an action, *without* taking this action out of the list of untried actions.
            :param action: the action to execute
+           :param widening: a ProgressiveWidening that limits the number of distinct outcomes of a tried action
            :return: a new node obtained by applying the action in the current node """
         if most_probable:
             effect = action.effects[0]
@@ -34,86 +179,181 @@ class Node:
             effect = action.outcome()  # trigger one of the effects of the action
         if (action, effect) in self.children:  # check whether we already applied this action, and gotten this effect
             child = self.children[(action, effect)]  # we already encountered this state; retrieve it
+        elif widening and action in self.tried_actions and not self._widen(action, widening):
+            # no more outcomes are allowed; pick one of the outcomes so far according to their relative probability
+            outcomes = self.outcomes[action]
+            child = choices(outcomes, [child.effect.probability for child in outcomes])[0]
         else:
-            state = self.state - effect.delete | effect.add  # compute the new state by using set operations
+            state = self.problem.successor(self.state, effect)  # compute the new state by using set operations
             child = Node(self.problem, self, action, effect, state)  # create a new node with state
-            self.children[(action, effect)] = child  # add this child to the children of this node
+            self.add_child(child)  # add this child to the children of this node
         return child
 
+    def _widen(self, action, widening):
+        """ Verify whether progressive widening allows a new outcome for a tried action.
+        :param action: the tried action for which a new outcome was sampled
+        :param widening: the ProgressiveWidening to apply
+        :return: True if a new outcome is allowed; False otherwise """
+        outcomes = len(self.outcomes.get(action, ())) if self.outcomes else 0
+        return widening.allows(outcomes, self.tried_actions[action][1])
+
     def perform_action(self, action):
         """ Execute the rollout of an action, *with* taking this action out of the list of untried actions.
            :param action: the action to execute
            :return: a new node obtained  through action in the current node, and the reward associated with this effect
            :raises: a ValueError if trying to perform an action that is already tried for this node """
-        self.untried_actions.remove(action)  # remove the action from the list of untried actions
-        self.tried_actions[action] = (0, 0)  # add the action to the sequence of actions we already tried
+        if action not in self.untried_actions:  # also covers the empty tuple once all actions are tried
+            raise ValueError("the action " + action.name + " is not an untried action of this node")
+        self._untried_actions.remove(action)  # remove the action from the list of untried actions
+        if not self._untried_actions:  # once all actions are tried, share a single empty tuple rather than a list
+            self._untried_actions = ()
+        self.tried_actions[action] = [0, 0]  # add the action to the sequence of actions we already tried
         return self.simulate_action(action)  # get and return (one of) the child(ren) as a result of applying the action
 
-    def rollout_actions(self, rollout_action, depth, horizon):
-        """ Organise a rollout from a given node to either a goal node or a leaf node (e.g. by hitting the horizon).
-           :param rollout_action: the heuristic to select the action to use for the rollout
-           :param depth: the current depth at which the rollout is requested
-           :param horizon: the maximum depth to consider
-           :return: a new node obtained  through action in the current node, and the reward associated with this effect
-           :raises: a ValueError if trying to perform an action that is already tried for this node """
-        if self.is_goal:  # check if we have hit a goal state
-            return self, depth
-        elif depth < horizon:
-            action = rollout_action(self)  # use the heuristic to select the next action to perform
-            node = self.simulate_action(action, True)  # simulate the execution of this action
-            return node.rollout_actions(rollout_action, depth + 1, horizon)
-        else:  # the horizon has been reached; return the current node, reward so far, and the current depth
-            return self, depth
-
-    def update(self, discounting):
-        """ Traverse back up a branch to collect all rewards and to backpropagate these rewards to successor nodes.
-            :param discounting: the discounting factor to use when updating ancestor nodes """
-        node = self  # set this node as the current node in the backpropagation
-        current_reward = 0  # initialise the reward to 0
-        while node is not None:  # continue until we have processed the root node
+    def rollout_actions(self, rollout_action, depth, horizon, discounting=1, cache=None, max_steps=None, evaluate=None,
+                        actions=None):
+        """ Organise a rollout from this node to either a goal node or a leaf node (e.g. by hitting the horizon).
+           See the rollout function for the meaning of the parameters and the return value. """
+        return rollout(self, rollout_action, depth, horizon, discounting, cache, max_steps, evaluate, actions)
+
+    @staticmethod
+    def backup(path, discounting, reward=0, rave_actions=None):
+        """ Backpropagate the rewards along the path of nodes visited during an iteration, updating the statistics
+            in place. This does not rely on the parent of each node, which is only referenced weakly.
+        :param path: the nodes visited in the iteration, starting with the root node
+        :param discounting: the discounting factor to use when updating ancestor nodes
+        :param reward: the discounted reward obtained below the last node of the path, e.g. by a rollout
+        :param rave_actions: if given, the actions performed below the last node of the path, e.g. during a rollout;
+                             the AMAF statistics of each node are then updated for all actions performed after it """
+        current_reward = reward
+        goal_reward = path[0].problem.goal_reward
+        later_actions = None if rave_actions is None else set(rave_actions)  # the actions performed below the node
+        for index in range(len(path) - 1, -1, -1):
+            node = path[index]
             current_reward *= discounting  # discount the reward obtained in descendants
-            if node.is_goal:  # check if this node is a goal state
-                current_reward += self.problem.goal_reward  # if it is, assign to it the goal reward
+            if node.is_goal:
+                current_reward += goal_reward
             if node.effect:
-                current_reward += node.effect.reward  # add any rewards obtained associated with the effect
-            if not node.parent or node.action in node.parent.tried_actions:  # only update the real non-simulated nodes
-                if node.parent:  # check if it is not the root node; continue if not
-                    utility, visits = node.parent.tried_actions[node.action]  # get the action info from the parent
-                    node.parent.tried_actions[node.action] = (utility + current_reward, visits + 1)  # and update
-                node.utility += current_reward  # update the total utility gathered in this node
-                node.visits += 1  # update the  number of visits to this node
-            node = node.parent  # move to the parent node
-
-    def create_graphviz(self, location="graphviz.dot"):
-        """ Produce the contents for a Graphviz DOT file representing the search tree as starting from this node.
+                current_reward += node.effect.reward
+            if index:  # check if it is not the root node; if not, update the action info in the parent
+                statistics = path[index - 1].tried_actions[node.action]
+                statistics[0] += current_reward
+                statistics[1] += 1
+                if later_actions is not None:  # credit all the actions performed after the parent node
+                    later_actions.add(node.action)
+                    _update_amaf(path[index - 1], later_actions, current_reward)
+            node.utility += current_reward  # update the total utility gathered in this node
+            node.visits += 1  # update the  number of visits to this node
+
+    def create_graphviz(self, location="graphviz.dot", **bounds):
+        """ Produce a Graphviz DOT file representing the search tree as starting from this node.
         :param location: the location of where to save the generated file.
+        :param bounds: the named bounds max_depth, min_visits, and top_k to limit the size of the file,
+                       see export.walk_tree
         :return: the location where the Graphviz DOT file has been saved """
-        output = "graph sparsepy {\n"
-        output += textwrap.indent(self.__graphviz(), "  ")
-        output += "}"
-        with open(location, 'w') as file:
-            file.write(output)
-        return location
-
-    def __graphviz(self, name="0"):
-        """ Internal method used in the creation of the Graphviz DOT file. This method will be called recursively,
-            and only helps to fill the body specifications of the DOT file. """
-        output = 'decision_node' + str(name)  # give a unique name to this node
-        output += ' [label="' + ', '.join(self.state) + '\n' + \
-                  str('%0.2f' % self.utility) + ',' + str(self.visits) + '"]\n'  # add the label to identify its state
-        next_id = 0
-        for key, child in self.children.items():
-            (action, effect) = key  # extract the action out of the (action, effect) pair
-            if action in self.tried_actions:  # if this is an action we actually performed, not just simulated: show it
-                output += 'action_node' + str(name) + action.name
-                output += '[label="' + action.name + '", shape=box]\n'
-                child_node_name = name + '_' + str(next_id)
-                output += child.__graphviz(child_node_name)
-                output += 'action_node' + str(name) + action.name + ' -- '
-                output += 'decision_node' + str(child_node_name) + ' [style=dashed, label="' + str(effect) + '"]\n'
-                next_id += 1
-        for action, info in self.tried_actions.items():
-            reward, visits = info
-            output += 'decision_node' + str(name) + ' -- action_node' + str(name) + action.name
-            output += ' [label="' + '%0.2f' % reward + ',' + str(visits) + '", penwidth="' + str(visits**(1/4)) + '"]\n'
-        return output
+        return export_tree(self, location, "graphviz", **bounds)
+
+
+class OpenLoopNode:
+    """ A node in an open-loop search tree, which represents the sequence of actions leading to it rather than a state.
+        The children of a node are key-ed by action only, and the statistics of a node accumulate over all the states
+        reached by its action sequence. As states are not stored, they are re-sampled on each iteration by simulating
+        the action sequence; during an iteration, a node holds the state sampled for it in that iteration. """
+    __slots__ = ['problem', 'action', 'state', 'is_goal', '_applicable', 'children', 'visits', 'utility', 'statistics',
+                 'amaf']
+
+    def __init__(self, problem, action):
+        self.problem = problem  # the problem space in which this node is relevant
+        self.action = action  # action that was used to get from the parent node to this node
+        self.state = None  # the state sampled for this node in the current iteration
+        self.is_goal = False  # whether or not the state sampled for this node is a goal state
+        self._applicable = None  # the actions applicable in the sampled state; determined on first access
+        self.children = dict()  # dictionary of children of this node, key-ed by the action to get to them
+        self.visits = 0  # number of times this node has been visited
+        self.utility = 0  # cumulative utility from going through this node
+        self.statistics = {}  # dictionary with the actions we tried so far in any of the sampled states as keys,
+        # and linked to a list consisting of their total reward and number of times we applied them
+        self.amaf = None  # dictionary with the same structure, for the all-moves-as-first statistics used by RAVE
+
+    def sample(self, state):
+        """ Set the state sampled for this node in the current iteration.
+        :param state: the sampled state """
+        self.state = state
+        self.is_goal = self.problem.goal_reached(state)
+        self._applicable = None
+
+    @property
+    def applicable_actions(self):
+        """ Getter for the actions which are applicable in the sampled state.
+        :return: the list of applicable actions """
+        if self._applicable is None:
+            self._applicable = self.problem.applicable_actions(self.state)
+        return self._applicable
+
+    @property
+    def untried_actions(self):
+        """ Getter for the actions which are applicable in the sampled state, but which we did not try yet.
+        :return: the list of untried actions """
+        return [action for action in self.applicable_actions if action not in self.statistics]
+
+    @property
+    def tried_actions(self):
+        """ Getter for the statistics of the actions which we tried so far, and which are applicable in the sampled
+            state; in the same form as the tried actions of a Node, so the same heuristics can be used.
+        :return: a dictionary with the tried applicable actions as keys, linked to their total reward and visits """
+        return {action: self.statistics[action] for action in self.applicable_actions if action in self.statistics}
+
+    def simulate_action(self, action):
+        """ Execute an action in the sampled state, and sample the state of the child node for the action,
+            creating the child node if this action was not tried before.
+        :param action: the action to execute
+        :return: the child node for the action, and the reward obtained by executing the action """
+        if action not in self.children:
+            self.children[action] = OpenLoopNode(self.problem, action)
+            self.statistics[action] = [0, 0]
+        child = self.children[action]
+        effect = action.outcome()  # trigger one of the effects of the action
+        child.sample(self.problem.successor(self.state, effect))
+        return child, effect.reward + (self.problem.goal_reward if child.is_goal else 0)
+
+    @staticmethod
+    def backup(path, rewards, discounting, reward=0, rave_actions=None):
+        """ Backpropagate the rewards along the path of nodes visited during an iteration.
+        :param path: the nodes visited in the iteration, starting with the root node
+        :param rewards: the reward obtained upon reaching each of the nodes in the path
+        :param discounting: the discounting factor to use when updating ancestor nodes
+        :param reward: the discounted reward obtained below the last node of the path, e.g. by a rollout
+        :param rave_actions: if given, the actions performed below the last node of the path, e.g. during a rollout;
+                             the AMAF statistics of each node are then updated for all actions performed after it """
+        current_reward = reward
+        later_actions = None if rave_actions is None else set(rave_actions)  # the actions performed below the node
+        for index in range(len(path) - 1, -1, -1):
+            node = path[index]
+            current_reward = current_reward * discounting + rewards[index]
+            if index:  # check if it is not the root node; if not, update the action info in the parent
+                statistics = path[index - 1].statistics[node.action]
+                statistics[0] += current_reward
+                statistics[1] += 1
+                if later_actions is not None:  # credit all the actions performed after the parent node
+                    later_actions.add(node.action)
+                    _update_amaf(path[index - 1], later_actions, current_reward)
+            node.utility += current_reward  # update the total utility gathered in this node
+            node.visits += 1  # update the  number of visits to this node
+
+
+class RolloutNode:
+    """ A lightweight stand-in for a Node, used for the states visited during a rollout. Rollout nodes are not part of
+        the search tree, and only offer what rollout heuristics need: the problem, the state, whether it is a goal,
+        and the actions applicable in it (all of which are untried, as actions are never tried during a rollout). """
+    __slots__ = ['problem', 'state', 'is_goal']
+
+    def __init__(self, problem, state):
+        self.problem = problem  # the problem space in which this node is relevant
+        self.state = state  # the state of the world in this node
+        self.is_goal = problem.goal_reached(state)  # whether or not this node represents a goal state
+
+    @property
+    def untried_actions(self):
+        """ Getter for the actions which are applicable in the state of this node.
+        :return: the list of applicable actions """
+        return self.problem.applicable_actions(self.state)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+"""
+This module implements a long-lived planning service around mcts(), backed by a warm pool of worker processes.
+
+Problems are parsed once by the service and shipped to every worker, where they stay loaded.
+ Each worker keeps the search trees of the sessions pinned to it, so that the next decision of a session
+ continues from the subtree that matches the observed state rather than from an empty tree; the least recently
+ used sessions are evicted once a worker keeps too many of them, so that clients which disappear without a "close"
+ do not keep their search trees alive forever.
+ Workers take whatever requests are queued up in one go, up to a maximum, but handle them one at a time and send
+ back each response as soon as its request is handled; the searches of these requests are not combined in any way.
+ Loading a problem under the name of an earlier problem replaces it, and ends the sessions of the earlier problem.
+
+The protocol consists of JSON objects, one per line, on stdin/stdout or on a local socket:
+  {"id": 1, "op": "load", "problem": "maffia", "source": "(define (problem ...) ...)"}
+  {"id": 2, "op": "plan", "problem": "maffia", "session": "agent-1", "state": ["guns", "riches"], "seconds": 0.05}
+  {"id": 3, "op": "close", "session": "agent-1"}
+  {"id": 4, "op": "stats"}
+A "load" can refer to a file instead using "file", which may also be a compiled problem file (see problem_files.py),
+ and a "plan" can use "iterations" instead of "seconds", as well as set "horizon" and "discounting".
+ As loading a compiled problem file unpickles it, which can execute arbitrary code, files can only be loaded from
+ the problem directory the service is started with, and not at all if it has none; the "file" is then resolved
+ relative to the problem directory, and files outside of it are refused.
+ Each response repeats the "id" of its request; failed requests are answered with an "error" message instead.
+"""
+import json
+import multiprocessing
+import os
+import queue
+import socketserver
+import sys
+import threading
+import zlib
+from collections import deque
+from itertools import count
+from time import perf_counter
+
+from budget import iteration_budget, timed_budget
+from cache import LRUCache
+from mcts import mcts
+from policies import ucb1_select_action
+from search_structure import Node
+
+__author__ = "Kim Bauters"
+
+
+def _worker(index, requests, responses, batch_size, max_sessions):
+    """ Main loop of a worker process. All requests queued up on the worker's own queue are taken at once, up to a
+        maximum, and handled one at a time; the response of each request is returned as soon as it is handled,
+        as a list with one (ticket, response) pair.
+    :param index: the index of this worker in the pool
+    :param requests: the queue from which this worker receives its requests
+    :param responses: the queue, shared by all workers, on which to put the responses
+    :param batch_size: the maximum number of queued requests to take from the queue at once
+    :param max_sessions: the maximum number of sessions of which to keep the search tree """
+    problems = {}  # the problems loaded in this worker, key-ed by their name
+    sessions = LRUCache(max_sessions)  # the search tree kept for each session, as (problem name, root node, action)
+    select_action = ucb1_select_action()
+    running = True
+    while running:
+        batch = [requests.get()]  # block until there is work to do ...
+        while len(batch) < batch_size:  # ... and take whatever else is queued up already
+            try:
+                batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+
+        for ticket, op, message in batch:  # handle the requests one at a time
+            if op == "stop":
+                running = False
+                continue
+            if op == "load":  # a load is broadcast to all workers, and does not require a response
+                name = message["problem"]
+                problems[name] = message["compiled"]
+                for session, (problem_name, _, _) in sessions.items():
+                    if problem_name == name:  # the search trees of these sessions are built on the replaced problem
+                        sessions.pop(session)
+                continue
+            start_time = perf_counter()
+            try:
+                if op == "close":
+                    response = {"closed": sessions.pop(message["session"], None) is not None}
+                else:
+                    response = _plan(problems, sessions, select_action, message)
+            except Exception as error:
+                response = {"error": type(error).__name__ + ": " + str(error)}
+            response["worker"] = index
+            response["service_time"] = perf_counter() - start_time
+            responses.put([(ticket, response)])  # do not hold the response back until the other requests are done
+
+
+def _plan(problems, sessions, select_action, message):
+    """ Decide on the next action for a plan request, reusing the search tree of its session where possible.
+    :param problems: the problems loaded in the worker
+    :param sessions: the search trees kept by the worker for each of its sessions
+    :param select_action: the heuristic used to select actions during the search
+    :param message: the plan request
+    :return: the response to the plan request """
+    name = message["problem"]
+    if name not in problems:
+        raise KeyError("the problem " + repr(name) + " has not been loaded")
+    problem = problems[name]
+    state = set(message["state"]) if "state" in message else set(problem.init)
+    if "iterations" in message:
+        budget = iteration_budget(int(message["iterations"]))
+    else:
+        budget = timed_budget(float(message.get("seconds", 0.05)))
+
+    session = message.get("session")
+    root = None
+    if session in sessions:
+        problem_name, previous, action = sessions.get(session)
+        if problem_name == name:
+            if previous.state == state:  # the state did not change, e.g. when asking for the same decision again
+                root = previous
+            else:  # otherwise, look for the outcome of the chosen action that matches the observed state
+                for (child_action, _), child in previous.children.items():
+                    if child_action is action and child.state == state:
+                        root = child
+                        root.parent = None  # detach the subtree so that the rest of the old tree can be released
+                        break
+    reused = root is not None
+    if root is None:
+        root = Node(problem, None, None, None, state)
+
+    action = mcts(state, problem, budget, int(message.get("horizon", 50)), select_action=select_action,
+                  discounting=float(message.get("discounting", 0.9)), root=root)
+    if session is not None:
+        sessions.put(session, (name, root, action))
+    return {"action": action.name, "reused": reused, "visits": root.visits}
+
+
+class PlannerServer:
+    """ A planning service which dispatches requests to a pool of worker processes. """
+    def __init__(self, workers=None, batch_size=16, latency_window=1000, max_sessions=1000, problem_directory=None):
+        """
+        :param workers: the number of worker processes; defaults to the number of CPUs
+        :param batch_size: the maximum number of queued requests a worker takes from its queue at once
+        :param latency_window: the number of most recent requests to consider for the latency statistics
+        :param max_sessions: the maximum number of sessions of which each worker keeps the search tree; the least
+                             recently used sessions are evicted beyond that, as if they were closed
+        :param problem_directory: the directory of the (trusted) files which "load" requests can refer to, or None
+                                  to only allow problems to be loaded from their source
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.max_sessions = max_sessions
+        self.problem_directory = problem_directory
+        self._processes = []
+        self._requests = []  # the request queue of each worker
+        self._responses = None  # the response queue, shared by all workers
+        self._collector = None  # the thread that dispatches the responses from the workers
+        self._lock = threading.Lock()
+        self._tickets = count()
+        self._pending = {}  # the requests in progress, as ticket -> (request id, reply function, start time, worker)
+        self._depth = [0] * self.workers  # the number of requests in progress for each worker
+        self._latencies = deque(maxlen=latency_window)
+        self._problems = {}  # the problems loaded so far, as name -> number of actions
+        self._handled = 0
+
+    def start(self):
+        """ Start the worker processes, and the thread that collects their responses. """
+        self._responses = multiprocessing.Queue()
+        for index in range(self.workers):
+            requests = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_worker, daemon=True, args=(
+                index, requests, self._responses, self.batch_size, self.max_sessions))
+            process.start()
+            self._requests.append(requests)
+            self._processes.append(process)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        return self
+
+    def stop(self):
+        """ Stop the worker processes once they have finished the requests queued up so far. """
+        for requests in self._requests:
+            requests.put((None, "stop", None))
+        for process in self._processes:
+            process.join()
+        self._responses.put(None)  # signal the collector thread to stop
+        self._collector.join()
+        self._processes, self._requests = [], []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def add_problem(self, name, problem):
+        """ Load a problem in every worker, so that it can be referred to by name in plan requests.
+        :param name: the name to refer to the problem with
+        :param problem: the Problem instance to load """
+        for requests in self._requests:
+            requests.put((None, "load", {"problem": name, "compiled": problem}))
+        self._problems[name] = len(problem.actions)
+
+    def submit(self, message, reply):
+        """ Handle a single request, and eventually call reply with its response.
+        :param message: the request, as a dictionary following the protocol
+        :param reply: a function that is called with the response, as a dictionary, once it is available """
+        start_time = perf_counter()
+        op = message.get("op", "plan")
+        try:
+            if op == "load":
+                if "source" in message:
+                    from pdo_parser import PDOParser  # only pay for importing the parser when needed
+                    problem = PDOParser().process_input(message["source"])
+                else:  # a file can also be a compiled problem file, which is loaded without the parser
+                    from problem_files import load_problem
+                    problem = load_problem(self._problem_file(message["file"]))
+                name = message.get("problem", problem.name)
+                self.add_problem(name, problem)
+                response = {"problem": name, "actions": len(problem.actions)}
+            elif op == "stats":
+                response = self.statistics()
+            elif op in ("plan", "close"):
+                session = message.get("session")
+                with self._lock:
+                    if session is None:  # requests without a session go to the least busy worker ...
+                        worker = self._depth.index(min(self._depth))
+                    else:  # ... whereas sessions are pinned to a worker, which keeps their search tree
+                        worker = zlib.crc32(str(session).encode()) % self.workers
+                    ticket = next(self._tickets)
+                    self._pending[ticket] = (message.get("id"), reply, start_time, worker)
+                    self._depth[worker] += 1
+                self._requests[worker].put((ticket, op, message))
+                return
+            else:
+                raise ValueError("unknown operation " + repr(op))
+        except Exception as error:
+            response = {"error": type(error).__name__ + ": " + str(error)}
+        response["id"] = message.get("id")
+        reply(response)
+
+    def _problem_file(self, name):
+        """ Resolve the file of a "load" request, making sure it is inside the problem directory.
+        :param name: the name of the file, relative to the problem directory
+        :return: the location of the file
+        :raises: a PermissionError if there is no problem directory, or if the file is outside of it """
+        if self.problem_directory is None:
+            raise PermissionError("loading problems from files is not enabled")
+        directory = os.path.realpath(self.problem_directory)
+        location = os.path.realpath(os.path.join(directory, name))
+        if os.path.commonpath([directory, location]) != directory:
+            raise PermissionError("the file " + repr(name) + " is outside of the problem directory")
+        return location
+
+    def _collect(self):
+        """ Dispatch the responses from the workers to the functions waiting for them. """
+        while True:
+            results = self._responses.get()
+            if results is None:
+                break
+            for ticket, response in results:
+                with self._lock:
+                    request_id, reply, start_time, worker = self._pending.pop(ticket)
+                    self._depth[worker] -= 1
+                    response["latency"] = perf_counter() - start_time
+                    self._latencies.append(response["latency"])
+                    self._handled += 1
+                response["id"] = request_id
+                reply(response)
+
+    def statistics(self):
+        """ Report the queue depth and the latency of the most recent requests.
+        :return: a dictionary with the statistics of this server """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            depth = list(self._depth)
+            handled = self._handled
+        stats = {"queue_depth": sum(depth), "worker_queue_depth": depth, "handled": handled,
+                 "problems": dict(self._problems)}
+        if latencies:
+            stats["latency"] = {"mean": sum(latencies) / len(latencies),
+                                "p50": latencies[int(0.50 * (len(latencies) - 1))],
+                                "p99": latencies[int(0.99 * (len(latencies) - 1))],
+                                "max": latencies[-1]}
+        return stats
+
+    def handle_line(self, line, reply):
+        """ Handle a single line of the protocol.
+        :param line: the line containing the request as a JSON object
+        :param reply: a function that is called with the response as a line, without the line ending """
+        try:
+            message = json.loads(line)
+        except ValueError as error:
+            reply(json.dumps({"id": None, "error": "invalid request: " + str(error)}))
+            return
+        self.submit(message, lambda response: reply(json.dumps(response)))
+
+    def serve_stdio(self, stdin=sys.stdin, stdout=sys.stdout):
+        """ Serve requests read from stdin, writing the responses to stdout, until stdin is closed. """
+        lock = threading.Lock()
+
+        def reply(line):
+            with lock:
+                stdout.write(line + "\n")
+                stdout.flush()
+
+        for line in stdin:
+            if line.strip():
+                self.handle_line(line, reply)
+
+    def serve_socket(self, host="127.0.0.1", port=7007):
+        """ Serve requests from clients connecting to a local socket, until interrupted. """
+        planner = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                lock = threading.Lock()
+
+                def reply(line):
+                    with lock:
+                        self.wfile.write((line + "\n").encode())
+
+                for line in self.rfile:
+                    if line.strip():
+                        planner.handle_line(line.decode(), reply)
+
+        with socketserver.ThreadingTCPServer((host, port), Handler) as tcp_server:
+            tcp_server.daemon_threads = True
+            tcp_server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve sparsepy planning requests.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=16, help="maximum number of requests taken at once")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="maximum number of sessions per worker")
+    parser.add_argument("--problem-directory", default=None,
+                        help="directory of trusted problem files that load requests can refer to")
+    parser.add_argument("--port", type=int, default=None, help="serve on a local socket rather than stdin/stdout")
+    arguments = parser.parse_args()
+    with PlannerServer(arguments.workers, arguments.batch_size, max_sessions=arguments.max_sessions,
+                       problem_directory=arguments.problem_directory) as planner_server:
+        if arguments.port is None:
+            planner_server.serve_stdio()
+        else:
+            planner_server.serve_socket(port=arguments.port)
@@ -0,0 +1,143 @@
+"""
+This module implements search sessions, which control the cyclic garbage collector around mcts() searches.
+
+Large searches allocate many nodes, sets and dictionaries, and the cyclic garbage collector repeatedly traverses
+ the growing search tree while doing so, which shows up as latency spikes. As search trees hold no reference cycles,
+ they are released by reference counting alone, so a SearchSession instead moves the long-lived objects, such as the
+ Problem and any compiled heuristics, into the permanent generation of the collector, disables the collector while
+ searching, and releases the search trees in bulk once a decision is done. Between decisions, the youngest
+ generation can still be collected to catch any cyclic garbage. SearchStatistics keep track of the time spent
+ searching, releasing trees, and collecting garbage.
+"""
+import gc
+from time import perf_counter
+
+from mcts import mcts
+from search_structure import Node
+
+__author__ = "Kim Bauters"
+
+
+class SearchStatistics:
+    """ Statistics of one or more searches, including the time spent by the cyclic garbage collector.
+        Pass an instance to mcts() as its statistics parameter to have it updated by the search. """
+    def __init__(self):
+        self.searches = 0  # the number of searches so far
+        self.iterations = 0  # the total number of iterations of all searches
+        self.seconds = 0.0  # the total time spent searching, including any garbage collection during the searches
+        self.collections = 0  # the number of garbage collections during the searches
+        self.collected = 0  # the number of objects collected during the searches
+        self.collector_seconds = 0.0  # the time spent by the garbage collector during the searches
+        self.release_seconds = 0.0  # the time spent releasing search trees, when released by a SearchSession
+        self._started = None  # the start time of the current search
+        self._collecting = None  # the start time of the current garbage collection
+
+    def start(self):
+        """ Start keeping track of a search, and of the garbage collections during it. """
+        self._started = perf_counter()
+        gc.callbacks.append(self._collector)
+
+    def stop(self, iterations):
+        """ Stop keeping track of a search.
+        :param iterations: the number of iterations of the search """
+        gc.callbacks.remove(self._collector)
+        self.seconds += perf_counter() - self._started
+        self.iterations += iterations
+        self.searches += 1
+        self._started = None
+
+    def _collector(self, phase, info):
+        """ Callback of the garbage collector, called at the start and the end of each collection. """
+        if phase == "start":
+            self._collecting = perf_counter()
+        elif self._collecting is not None:
+            self.collector_seconds += perf_counter() - self._collecting
+            self.collections += 1
+            self.collected += info["collected"]
+            self._collecting = None
+
+    def __str__(self):
+        output = "Search statistics:\n"
+        output += " " + str(self.searches) + " searches with " + str(self.iterations) + " iterations in " + \
+                  "%0.3f" % self.seconds + " seconds\n"
+        output += " " + str(self.collections) + " garbage collections, collecting " + str(self.collected) + \
+                  " objects in " + "%0.3f" % self.collector_seconds + " seconds\n"
+        output += " " + "%0.3f" % self.release_seconds + " seconds releasing search trees\n"
+        return output
+
+
+class SearchSession:
+    """ A context in which searches run without interruption by the cyclic garbage collector, for example:
+            with SearchSession(problem) as session:
+                action = session.search(state, timed_budget(0.05), 50)
+        The search tree of the latest decision is kept, so that the next search can continue from the subtree that
+        matches the observed state; the rest of the tree is released in bulk. """
+    def __init__(self, problem, freeze=True, collect_between=0):
+        """
+        :param problem: the problem to search in
+        :param freeze: whether to move all objects that exist when the session starts, such as the problem,
+                       into the permanent generation, so that the collector no longer traverses them
+        :param collect_between: the generation to collect after each decision, or None to not collect at all
+                                while the session is active
+        """
+        self.problem = problem
+        self.freeze = freeze
+        self.collect_between = collect_between
+        self.statistics = SearchStatistics()
+        self.root = None  # the root node of the search tree of the latest decision
+        self.action = None  # the action chosen in the latest decision
+        self._enabled = None  # whether the collector was enabled before the session started
+
+    def __enter__(self):
+        self._enabled = gc.isenabled()
+        gc.collect()  # start from a clean slate, so that no garbage is frozen
+        if self.freeze:
+            gc.freeze()
+        gc.disable()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+        if self.freeze:
+            gc.unfreeze()
+        if self._enabled:
+            gc.enable()
+
+    def search(self, root_state, budget, horizon, **search_options):
+        """ Decide on the next action, continuing from the previous search tree where possible.
+        :param root_state: the state in which to decide on an action
+        :param budget: the budget of the search
+        :param horizon: the maximum depth up to which to explore the search tree
+        :param search_options: any further (named) arguments to pass on to mcts()
+        :return: the next best action to take """
+        state = frozenset(root_state)
+        root = None
+        if self.root is not None:
+            if self.root.state == state:  # the state did not change, so continue with the same tree
+                root = self.root
+            else:  # otherwise, look for the outcome of the chosen action that matches the observed state
+                root = next((child for (action, _), child in self.root.children.items()
+                             if action is self.action and child.state == state), None)
+        if root is not self.root:
+            self.release(keep=root)
+        if root is None:
+            root = Node(self.problem, None, None, None, state)
+
+        self.action = mcts(state, self.problem, budget, horizon, root=root, statistics=self.statistics,
+                           **search_options)
+        self.root = root
+        if self.collect_between is not None:  # collect whatever cyclic garbage the decision left behind
+            started = perf_counter()
+            self.statistics.collected += gc.collect(self.collect_between)
+            self.statistics.collections += 1
+            self.statistics.collector_seconds += perf_counter() - started
+        return self.action
+
+    def release(self, keep=None):
+        """ Release the search tree of the latest decision in bulk, possibly keeping one of its subtrees.
+        :param keep: a node of the search tree whose subtree to keep, e.g. to continue the next search from it """
+        started = perf_counter()
+        if keep is not None:
+            keep.parent = None  # detach the subtree, so that releasing the rest of the tree leaves it intact
+        self.root = None  # as the tree has no reference cycles, this releases all of its other nodes at once
+        self.statistics.release_seconds += perf_counter() - started
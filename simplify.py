@@ -0,0 +1,153 @@
+"""
+This module implements a simplification pass which shrinks a parsed problem without changing its behaviour.
+
+The pass repeatedly (1) folds static atoms, i.e. atoms that no effect ever adds or deletes, into constants,
+ (2) removes actions that can never be applied, either because a static atom rules out all of their preconditions
+ or because their preconditions cannot be reached from the initial state even in the delete relaxation,
+ (3) removes irrelevant atoms, i.e. atoms that occur in no precondition or goal, and
+ (4) merges identical effects of an action, as well as effects that no longer change anything, by summing up
+ their probabilities.
+Note that the states of the simplified problem no longer contain the removed atoms, so a search should start
+ from the initial state of the simplified problem rather than from that of the original problem.
+"""
+import textwrap
+
+from data_structure import Action, Effect, Problem
+
+__author__ = "Kim Bauters"
+
+
+class SimplificationReport:
+    """ Provide an overview of everything that was removed from a problem by simplify_problem. """
+    def __init__(self):
+        self.static_atoms = {}  # the static atoms that were folded into constants, linked to their value
+        self.irrelevant_atoms = set()  # the atoms that were removed as they occur in no precondition or goal
+        self.removed_actions = {}  # the names of the actions that were removed, linked to the reason why
+        self.removed_preconditions = 0  # the number of preconditions that were removed as they can never hold
+        self.removed_goals = 0  # the number of goals that were removed as they can never hold
+        self.merged_effects = 0  # the number of effects that were removed by merging them with an identical effect
+
+    def __str__(self):
+        output = "Simplification report:\n"
+        output += " " + str(len(self.static_atoms)) + " static atoms folded into constants"
+        if self.static_atoms:
+            atoms = [atom if value else "-" + atom for atom, value in sorted(self.static_atoms.items())]
+            output += ":\n" + textwrap.indent(textwrap.fill(", ".join(atoms), 66), "  ")
+        output += "\n " + str(len(self.irrelevant_atoms)) + " irrelevant atoms removed"
+        if self.irrelevant_atoms:
+            output += ":\n" + textwrap.indent(textwrap.fill(", ".join(sorted(self.irrelevant_atoms)), 66), "  ")
+        output += "\n " + str(len(self.removed_actions)) + " actions removed"
+        if self.removed_actions:
+            output += ":\n" + "\n".join("  " + name + " (" + reason + ")"
+                                        for name, reason in sorted(self.removed_actions.items()))
+        output += "\n " + str(self.removed_preconditions) + " preconditions and " + \
+                  str(self.removed_goals) + " goals removed that can never hold"
+        output += "\n " + str(self.merged_effects) + " effects merged\n"
+        return output
+
+
+def _fold(conditions, static_atoms):
+    """ Fold the static atoms in a list of conjunctions of negative and positive atoms into constants.
+    :param conditions: the list of conjunctions, each as a pair (negative atoms, positive atoms)
+    :param static_atoms: the static atoms, linked to their value
+    :return: the conjunctions that can still hold, without the static atoms """
+    folded = []
+    for neg, pos in conditions:
+        if any(static_atoms.get(atom) is False for atom in pos) or any(static_atoms.get(atom) for atom in neg):
+            continue  # a static atom has the wrong value, so this conjunction can never hold
+        folded.append((set(neg) - static_atoms.keys(), set(pos) - static_atoms.keys()))
+    return folded
+
+
+def _relaxed_reachable(initial, atoms, actions):
+    """ Determine which actions can be applied in the delete relaxation of a problem, i.e. when atoms which are
+        reached are never lost again; for this purpose, an atom being false is treated as a separate fact.
+    :param initial: the initial state
+    :param atoms: all the atoms in the problem
+    :param actions: the candidate actions, each as a pair (preconditions, effects)
+    :return: the set of indices of the actions which can be applied """
+    true, false = set(initial), set(atoms) - set(initial)  # the atoms which can be true, resp. false
+    reachable = set()
+    changed = True
+    while changed:
+        changed = False
+        for index, (preconditions, effects) in enumerate(actions):
+            if index not in reachable and any(pos <= true and neg <= false for neg, pos in preconditions):
+                reachable.add(index)
+                for effect in effects:
+                    true |= effect.add
+                    false |= effect.delete
+                changed = True
+    return reachable
+
+
+def simplify_problem(problem):
+    """ Simplify a problem by removing static and irrelevant atoms, actions that can never be applied,
+        and duplicate effects.
+    :param problem: the problem to simplify; it is left unchanged
+    :return: a pair consisting of the simplified problem and a SimplificationReport """
+    report = SimplificationReport()
+    initial = set(problem.init)
+    goals = [(set(neg), set(pos)) for neg, pos in problem.goals]
+    # each action as a triple (name, preconditions, effects), leaving out the effects that can never occur
+    actions = [(action.name, [(set(neg), set(pos)) for neg, pos in action.preconditions],
+                [effect for effect in action.effects if effect.probability > 0]) for action in problem.actions]
+
+    changed = True
+    while changed:  # removing actions can make more atoms static, so continue until nothing changes
+        changed = False
+        # (1) fold the static atoms into constants
+        dynamic = {atom for _, _, effects in actions for effect in effects for atom in effect.add | effect.delete}
+        atoms = set(initial).union(*(neg | pos for neg, pos in goals),
+                                   *(neg | pos for _, preconditions, _ in actions for neg, pos in preconditions))
+        static_atoms = {atom: atom in initial for atom in atoms - dynamic}
+        if static_atoms:
+            report.static_atoms.update(static_atoms)
+            initial -= static_atoms.keys()
+            folded_goals = _fold(goals, static_atoms)
+            report.removed_goals += len(goals) - len(folded_goals)
+            goals = folded_goals
+            folded_actions = []
+            for name, preconditions, effects in actions:
+                folded = _fold(preconditions, static_atoms)
+                report.removed_preconditions += len(preconditions) - len(folded)
+                if folded:
+                    folded_actions.append((name, folded, effects))
+                else:
+                    report.removed_actions[name] = "never applicable"
+            actions = folded_actions
+
+        # (2) remove the actions which cannot be applied even in the delete relaxation
+        atoms |= dynamic
+        reachable = _relaxed_reachable(initial, atoms,
+                                       [(preconditions, effects) for _, preconditions, effects in actions])
+        if len(reachable) < len(actions):
+            for index, (name, _, _) in enumerate(actions):
+                if index not in reachable:
+                    report.removed_actions[name] = "unreachable"
+            actions = [action for index, action in enumerate(actions) if index in reachable]
+            changed = True
+        elif static_atoms:
+            changed = True
+
+    # (3) remove the atoms which occur in no precondition or goal, as they cannot influence anything
+    relevant = set().union(*(neg | pos for neg, pos in goals),
+                           *(neg | pos for _, preconditions, _ in actions for neg, pos in preconditions))
+    report.irrelevant_atoms = (initial | {atom for _, _, effects in actions for effect in effects
+                                          for atom in effect.add | effect.delete}) - relevant
+    initial &= relevant
+
+    # (4) merge the effects of each action which, with the irrelevant atoms removed, are identical
+    simplified_actions = []
+    for name, preconditions, effects in actions:
+        merged = {}  # the merged effects, key-ed by their delete set, add set, and reward
+        for effect in effects:
+            key = (frozenset(effect.delete & relevant), frozenset(effect.add & relevant), effect.reward)
+            if key in merged:
+                merged[key].probability = merged[key].exact_probability + effect.exact_probability
+                report.merged_effects += 1
+            else:
+                merged[key] = Effect(key[0], key[1], effect.exact_probability, effect.reward)
+        simplified_actions.append(Action(name, preconditions, list(merged.values())))
+
+    return Problem(problem.name, initial, goals, problem.goal_reward, simplified_actions), report
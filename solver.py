@@ -0,0 +1,127 @@
+"""
+This module implements an exact solver for problems whose reachable state space is small enough to enumerate.
+
+The states reachable from the initial state are enumerated first, after which the transitions of every applicable
+ action are stored as sparse (coordinate) arrays of state-action pairs, next states, and probabilities.
+ Value iteration is then performed with vectorised operations over these arrays, using the same rewards and
+ discounting as the backpropagation in Node.backup: the reward of an effect and the goal reward are obtained when
+ reaching a state, and goal states are terminal. The resulting values of the actions therefore correspond to the
+ average rewards which mcts() converges to, and the greedy policy can be looked up in constant time.
+"""
+from collections import deque
+
+import numpy as np
+
+__author__ = "Kim Bauters"
+
+
+class Solution:
+    """ The values and the greedy policy obtained by solving a problem exactly. """
+    def __init__(self, states, actions, values, q_values, pair_states, pair_actions):
+        self.states = states  # the reachable states, as frozensets
+        self.index = {state: index for index, state in enumerate(states)}  # the index of each reachable state
+        self.values = values  # the value of each reachable state
+        self.q_values = q_values  # the value of each state-action pair
+        self._pair_states = pair_states  # the state index of each state-action pair
+        self._pair_actions = pair_actions  # the action of each state-action pair
+        # the greedy policy, as the best action of each state; states without any actions have no entry
+        self.policy = {}
+        best = {}
+        for pair, state_index in enumerate(pair_states):
+            if state_index not in best or q_values[pair] > q_values[best[state_index]]:
+                best[state_index] = pair
+        for state_index, pair in best.items():
+            self.policy[states[state_index]] = actions[pair_actions[pair]]
+        self._actions = actions
+
+    def action(self, state):
+        """ Look up the best action in a state.
+        :param state: the state, which should be reachable from the initial state
+        :return: the best action, or None if no action is applicable (or the state is a goal) """
+        return self.policy.get(frozenset(state))
+
+    def value(self, state):
+        """ Look up the value of a state, i.e. the expected discounted reward when following the best actions.
+        :param state: the state, which should be reachable from the initial state
+        :return: the value of the state """
+        return float(self.values[self.index[frozenset(state)]])
+
+    def action_values(self, state):
+        """ Look up the values of all the actions applicable in a state.
+        :param state: the state, which should be reachable from the initial state
+        :return: a dictionary mapping each applicable action to its value """
+        state_index = self.index[frozenset(state)]
+        pairs = np.flatnonzero(self._pair_states == state_index)
+        return {self._actions[self._pair_actions[pair]]: float(self.q_values[pair]) for pair in pairs}
+
+
+def solve(problem, initial=None, discounting=0.9, horizon=None, tolerance=1e-9, max_iterations=100000,
+          max_states=1000000):
+    """ Solve a problem exactly, using value iteration over the states reachable from its initial state.
+    :param problem: the problem to solve
+    :param initial: the state from which to enumerate the reachable states; defaults to the initial state
+    :param discounting: the discounting factor, as used by mcts()
+    :param horizon: if given, the number of steps to consider, i.e. solve the problem for a finite horizon;
+                    otherwise, iterate until the values converge
+    :param tolerance: the largest change in the values for which they are considered converged
+    :param max_iterations: the maximum number of iterations when no horizon is given
+    :param max_states: the maximum number of reachable states to enumerate
+    :return: a Solution with the values and the greedy policy
+    :raises: a ValueError if more than max_states states are reachable """
+    initial = frozenset(problem.init if initial is None else initial)
+    actions = list(problem.actions)
+    action_index = {action: index for index, action in enumerate(actions)}
+
+    # enumerate the reachable states breadth-first, and collect the transitions as coordinate arrays
+    states, index = [initial], {initial: 0}
+    pair_states, pair_actions = [], []  # the state index and action index of each state-action pair
+    rows, columns, probabilities, rewards = [], [], [], []  # the pair, next state, probability, and reward
+    queue = deque([initial])
+    while queue:
+        state = queue.popleft()
+        if problem.goal_reached(state):  # goal states are terminal
+            continue
+        for action in problem.applicable_actions(state):
+            pair = len(pair_states)
+            pair_states.append(index[state])
+            pair_actions.append(action_index[action])
+            for effect in action.effects:
+                if effect.probability <= 0:
+                    continue
+                next_state = state - effect.delete | effect.add
+                if next_state not in index:
+                    if len(states) >= max_states:
+                        raise ValueError("more than " + str(max_states) + " states are reachable")
+                    index[next_state] = len(states)
+                    states.append(next_state)
+                    queue.append(next_state)
+                rows.append(pair)
+                columns.append(index[next_state])
+                probabilities.append(float(effect.probability))
+                rewards.append(effect.reward + (problem.goal_reward if problem.goal_reached(next_state) else 0))
+
+    rows = np.array(rows, dtype=np.intp)
+    columns = np.array(columns, dtype=np.intp)
+    probabilities = np.array(probabilities, dtype=float)
+    pair_states = np.array(pair_states, dtype=np.intp)
+    pair_count = len(pair_actions)
+    # the expected immediate reward of each state-action pair
+    immediate = np.bincount(rows, weights=probabilities * np.array(rewards, dtype=float), minlength=pair_count)
+    # the pairs are grouped per state, so the best pair of each state can be found with a reduction over the groups
+    acting, starts = np.unique(pair_states, return_index=True)
+
+    values = np.zeros(len(states))
+    q_values = immediate.copy()
+    iterations = horizon if horizon is not None else max_iterations
+    for _ in range(iterations):
+        q_values = immediate + discounting * np.bincount(rows, weights=probabilities * values[columns],
+                                                         minlength=pair_count)
+        new_values = np.zeros(len(states))  # states without applicable actions, and goal states, have no future
+        if pair_count:
+            new_values[acting] = np.maximum.reduceat(q_values, starts)
+        converged = np.max(np.abs(new_values - values), initial=0) <= tolerance
+        values = new_values
+        if horizon is None and converged:
+            break
+
+    return Solution(states, actions, values, q_values, pair_states, pair_actions)
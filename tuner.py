@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+This module implements a tuner for the parameters of mcts(), which finds the configuration that gives the best
+ reward per CPU-second on a given problem.
+
+A configuration consists of the horizon, the discounting factor, the exploration constant of the UCB1 (or RAVE)
+ selection, the selection policy, and the rollout policy. The tuner uses successive halving: it samples a number
+ of configurations from the search space, runs a batch of episodes with each, keeps the best fraction of them, and
+ runs a larger batch of episodes with the survivors, until a single configuration remains.
+ Each episode acts in the problem from its initial state, deciding on each action with mcts() using a fixed number
+ of iterations, until a goal is reached or a maximum number of steps is taken. All configurations are evaluated on
+ the same seeded episodes, which reduces the noise when comparing them: the outcomes of the actions are drawn from a
+ random generator of the episode's own, so they do not depend on how many random numbers each configuration uses
+ while searching. The episodes run in parallel in a pool of worker processes, and each starts with an empty
+ heuristic cache, so that its CPU time does not depend on the episodes the worker ran before. A configuration is
+ scored by its average (undiscounted) reward per episode, divided by its average CPU time per episode.
+"""
+import itertools
+import math
+import random
+from multiprocessing import Pool
+from time import process_time
+
+from budget import iteration_budget
+from heuristic import HFF
+from mcts import mcts
+from policies import greedy_rollout_action, rave_select_action, ucb1_select_action
+
+__author__ = "Kim Bauters"
+
+
+# the default search space, mapping each parameter to its candidate values
+DEFAULT_SPACE = {
+    "horizon": [10, 25, 50],
+    "discounting": [0.8, 0.9, 0.95, 0.99],
+    "exploration": [0.25, 1/math.sqrt(2), 1.0, 1.5, 2.0],
+    "selection": ["ucb1", "rave"],
+    "rollout": ["random", "greedy"],
+}
+
+
+class TuningResult:
+    """ The outcome of tuning, with the best configuration and the scores of all the evaluated configurations. """
+    def __init__(self, evaluations):
+        """
+        :param evaluations: the evaluated configurations, as a list of tuples (configuration, score, reward per
+                            episode, CPU-seconds per episode, episodes), sorted from best to worst
+        """
+        self.evaluations = evaluations
+        self.best = evaluations[0][0]  # the configuration with the best reward per CPU-second
+        self.score = evaluations[0][1]  # the reward per CPU-second of the best configuration
+
+    def __str__(self):
+        output = "Tuning report (reward per CPU-second, reward and CPU-seconds per episode, episodes):\n"
+        for configuration, score, reward, seconds, episodes in self.evaluations:
+            output += " %10.3f %8.3f %8.4f %5d  " % (score, reward, seconds, episodes)
+            output += ", ".join(name + "=" + ("%g" % value if isinstance(value, float) else str(value))
+                                for name, value in sorted(configuration.items())) + "\n"
+        return output
+
+
+# the context of the episodes in a worker process, set up once by _initialise
+_context = None
+
+
+def _initialise(problem, iterations, max_steps):
+    """ Set up the problem and the episode settings in a worker process. The FF heuristic is only compiled once,
+        while its cache is cleared for each task. """
+    global _context
+    _context = (problem, iterations, max_steps, HFF(problem))
+
+
+def _run_episodes(task):
+    """ Run a number of seeded episodes with a configuration.
+    :param task: a pair of the configuration and the list of seeds of the episodes
+    :return: a pair of the total reward of the episodes, and the CPU time they took """
+    configuration, seeds = task
+    problem, iterations, max_steps, heuristic = _context
+    options = {"discounting": configuration["discounting"]}
+    if configuration["selection"] == "rave":
+        options["select_action"] = rave_select_action(configuration["exploration"])
+        options["rave"] = True
+    else:
+        options["select_action"] = ucb1_select_action(configuration["exploration"])
+    if configuration["rollout"] == "greedy":
+        options["rollout_action"] = greedy_rollout_action(heuristic, epsilon=0.1)
+
+    total = 0
+    heuristic.clear_cache()  # do not let the CPU time depend on the tasks this worker performed before
+    started = process_time()
+    for seed in seeds:
+        random.seed(seed)  # the searches draw from the shared generator ...
+        environment = random.Random(seed)  # ... whereas the outcomes of the actions are drawn from their own
+        state = frozenset(problem.init)
+        for _ in range(max_steps):
+            if problem.goal_reached(state) or not problem.applicable_actions(state):
+                break
+            action = mcts(state, problem, iteration_budget(iterations), configuration["horizon"], **options)
+            effect = action.outcome(environment)
+            total += effect.reward
+            state = problem.successor(state, effect)
+        if problem.goal_reached(state):
+            total += problem.goal_reward
+    return total, process_time() - started
+
+
+def tune(problem, space=None, configurations=16, eta=2, episodes=4, iterations=200, max_steps=50, workers=None,
+         seed=0):
+    """ Find the configuration of mcts() which gives the best reward per CPU-second, using successive halving.
+    :param problem: the problem to tune for
+    :param space: the search space, as a dictionary mapping parameters to lists of candidate values; any parameter
+                  that is left out takes its values from DEFAULT_SPACE
+    :param configurations: the number of configurations to sample from the search space; if the search space holds
+                           fewer configurations, all of them are evaluated
+    :param eta: the factor by which the number of configurations is reduced, and the number of episodes per
+                configuration is increased, in each round
+    :param episodes: the number of episodes per configuration in the first round
+    :param iterations: the number of iterations of mcts() per decision
+    :param max_steps: the maximum number of steps per episode
+    :param workers: the number of worker processes; defaults to the number of CPUs
+    :param seed: the seed to sample the configurations and the episodes with
+    :return: a TuningResult """
+    space = dict(DEFAULT_SPACE, **(space or {}))
+    names = sorted(space)
+    generator = random.Random(seed)
+    grid = list(itertools.product(*(space[name] for name in names)))
+    if len(grid) > configurations:
+        grid = generator.sample(grid, configurations)
+    candidates = [dict(zip(names, values)) for values in grid]
+    results = [[0, 0.0, 0] for _ in candidates]  # the total reward, CPU-seconds and episodes of each configuration
+
+    def score(index):
+        reward, seconds, count = results[index]
+        return reward / count / max(seconds / count, 1e-9)
+
+    dropped = []  # the configurations dropped in each round, from best to worst
+    survivors = list(range(len(candidates)))
+    with Pool(workers, initializer=_initialise, initargs=(problem, iterations, max_steps)) as pool:
+        while survivors:
+            # all configurations in a round are evaluated on the same episodes, with one task per episode
+            seeds = [generator.randrange(2 ** 32) for _ in range(episodes)]
+            tasks = [(candidates[index], [episode_seed]) for index in survivors for episode_seed in seeds]
+            for position, (reward, seconds) in enumerate(pool.map(_run_episodes, tasks)):
+                index = survivors[position // len(seeds)]
+                results[index][0] += reward
+                results[index][1] += seconds
+                results[index][2] += 1
+            survivors.sort(key=score, reverse=True)
+            if len(survivors) == 1:
+                break
+            kept = max(1, len(survivors) // eta)
+            dropped.append(survivors[kept:])
+            survivors = survivors[:kept]
+            episodes *= eta
+    # order the configurations from the best one to the worst one dropped in the first round
+    evaluations = survivors + [index for round_dropped in reversed(dropped) for index in round_dropped]
+    return TuningResult([(candidates[index], score(index), results[index][0] / results[index][2],
+                          results[index][1] / results[index][2], results[index][2]) for index in evaluations])
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Tune the parameters of the search for a PPDDL problem.")
+    parser.add_argument("problem", help="the PPDDL problem description or compiled problem file")
+    parser.add_argument("--configurations", type=int, default=16, help="number of configurations to sample")
+    parser.add_argument("--episodes", type=int, default=4, help="number of episodes per configuration at first")
+    parser.add_argument("--iterations", type=int, default=200, help="number of iterations per decision")
+    parser.add_argument("--max-steps", type=int, default=50, help="maximum number of steps per episode")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the configurations and the episodes")
+    arguments = parser.parse_args()
+    from problem_files import load_problem
+    tuned_problem = load_problem(arguments.problem)
+    print(tune(tuned_problem, configurations=arguments.configurations, episodes=arguments.episodes,
+               iterations=arguments.iterations, max_steps=arguments.max_steps, workers=arguments.workers,
+               seed=arguments.seed))
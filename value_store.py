@@ -0,0 +1,252 @@
+"""
+This module implements a persistent store of the values of states, accumulated over the searches of many runs.
+
+The store keeps, for each state and each action tried in it, the total number of visits and the total return, as
+ found by finished searches. States are key-ed by a compact encoding as a bitset over the atoms of the problem, and
+ the statistics are kept in an embedded SQLite database, which is bounded in size by evicting the least recently
+ used entries, i.e. the entries of the states least recently looked up or recorded. Recording a search only adds its
+ statistics to an in-memory buffer, which a background thread flushes to the database at regular intervals over its
+ own connection, so that neither recording nor looking up statistics has to wait for the database writes.
+The accumulated statistics can warm-start new searches in two ways: passed to mcts() as its value_store, new nodes
+ are seeded with the statistics as prior visits and returns of their actions; passed as leaf_value=store.leaf_value,
+ the mean return of a state is used to evaluate the nodes in which rollouts end.
+"""
+import sqlite3
+import threading
+import weakref
+import zlib
+
+from cache import LRUCache
+
+__author__ = "Kim Bauters"
+
+
+def _merge(statistics, additional):
+    """ Add statistics of the actions tried in a state to other statistics of the same state.
+    :param statistics: a dictionary mapping action indices to a pair of their total visits and return
+    :param additional: a dictionary mapping action indices to further visits and return
+    :return: a new dictionary with the combined statistics """
+    statistics = dict(statistics)
+    for action, (visits, utility) in additional.items():
+        stored_visits, stored_utility = statistics.get(action, (0, 0))
+        statistics[action] = (stored_visits + visits, stored_utility + utility)
+    return statistics
+
+
+class ValueStore:
+    """ A persistent, size-bounded store of the visits and returns of the actions tried in states of a problem. """
+    def __init__(self, location, problem, max_entries=1000000, flush_interval=5.0, max_prior_visits=20,
+                 cache_size=100000):
+        """
+        :param location: the location of the SQLite database; it is created if it does not exist yet
+        :param problem: the problem of the states to store; a database can only be used with the same problem
+        :param max_entries: the maximum number of (state, action) entries to keep in the database
+        :param flush_interval: the number of seconds between flushes of the recorded statistics to the database
+        :param max_prior_visits: the maximum number of visits of an action with which to seed a node,
+                                 so that the statistics of new searches can still outweigh history
+        :param cache_size: the maximum number of states of which to keep the statistics in memory
+        :raises: a ValueError if the database was created for a different problem
+        """
+        self.location = location
+        self.problem = problem
+        self.max_entries = max_entries
+        self.max_prior_visits = max_prior_visits
+        atoms = sorted(problem.atoms())
+        self._atom_bits = {atom: 1 << index for index, atom in enumerate(atoms)}
+        self._state_size = (len(atoms) + 7) // 8  # the number of bytes needed for a state
+        self._actions = {action: index for index, action in enumerate(problem.actions)}
+        self._cache = LRUCache(cache_size)  # the statistics read from the database, key-ed by the encoded state
+        self._pending = {}  # the recorded statistics which are not flushed yet, as key -> action index -> statistics
+        self._flushing = {}  # the recorded statistics which are being flushed, but which are not committed yet
+        self._read = set()  # the encoded states looked up since the previous flush, to mark their entries as used
+        self._seeded = weakref.WeakKeyDictionary()  # the prior statistics with which each node was seeded
+        self._lock = threading.Lock()  # protects the cache, the buffers, and the connection used for reading
+        self._flush_lock = threading.Lock()  # makes sure only one flush is in progress at any time
+        self._clock = 0  # increases with each flush, to determine which entries were used least recently
+
+        signature = zlib.crc32("\n".join([problem.name] + atoms + [action.name for action in problem.actions])
+                               .encode("utf-8"))
+        self._connection = sqlite3.connect(location, check_same_thread=False)  # used to look up statistics
+        self._connection.execute("PRAGMA journal_mode=WAL")  # so that reading does not wait for flushes, and vice versa
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS action_values (state BLOB, action INTEGER, "
+                                     "visits INTEGER, utility REAL, used INTEGER, PRIMARY KEY (state, action)) "
+                                     "WITHOUT ROWID")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS action_values_used ON action_values (used)")
+            self._connection.execute("INSERT OR IGNORE INTO meta VALUES ('signature', ?)", (signature,))
+            self._connection.execute("INSERT OR IGNORE INTO meta VALUES ('clock', 0)")
+        stored = dict(self._connection.execute("SELECT key, value FROM meta"))
+        if stored["signature"] != signature:
+            self._connection.close()
+            raise ValueError("the value store " + str(location) + " was made for a different problem than " +
+                             problem.name)
+        self._clock = stored["clock"]
+        self._writer = sqlite3.connect(location, check_same_thread=False)  # only used to flush the statistics
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+
+        self._stopping = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True)
+        self._flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def encode(self, state):
+        """ Encode a state compactly, as a bitset over the atoms of the problem.
+        :param state: the state to encode
+        :return: the encoded state, as bytes """
+        return sum(self._atom_bits[atom] for atom in state).to_bytes(self._state_size, "little")
+
+    def lookup(self, state):
+        """ Look up the accumulated statistics of the actions tried in a state, including those not flushed yet.
+        :param state: the state to look up
+        :return: a dictionary mapping the index of each tried action to a pair of its total visits and return """
+        key = self.encode(state)
+        with self._lock:  # the background thread may be flushing, which changes both the cache and the buffers
+            self._read.add(key)
+            statistics = self._cache.get(key)
+            if statistics is None:  # the cache holds the committed statistics, as does the database
+                rows = self._connection.execute("SELECT action, visits, utility FROM action_values WHERE state = ?",
+                                                (key,)).fetchall()
+                statistics = {action: (visits, utility) for action, visits, utility in rows}
+                self._cache.put(key, statistics)
+            for buffer in (self._flushing, self._pending):
+                if key in buffer:
+                    statistics = _merge(statistics, buffer[key])
+        return statistics
+
+    def value(self, state):
+        """ Determine the mean return obtained from a state onwards, over all the actions tried in it.
+        :param state: the state to look up
+        :return: the mean return, or None if no action was ever tried in the state """
+        statistics = self.lookup(state)
+        visits = sum(visits for visits, _ in statistics.values())
+        return sum(utility for _, utility in statistics.values()) / visits if visits else None
+
+    def leaf_value(self, node, discounting=None):
+        """ Estimate the discounted reward obtainable below a node by the mean return of its state, for use as the
+            leaf_value of mcts(); states without any history are estimated to have no further reward. The discounting
+            factor is not used, as the stored returns are discounted already. """
+        value = self.value(node.state)
+        return 0 if value is None else value
+
+    def seed(self, node, discounting=0.9):
+        """ Seed a node that was not visited yet with the accumulated statistics of its state, as prior statistics
+            of its tried actions; the visits of each action are capped by max_prior_visits, keeping its mean return.
+        :param node: the node to seed
+        :param discounting: the discounting factor of the search, to derive the utility of the node itself
+        :return: True if the node was seeded; False if there are no statistics of its state """
+        if node.visits or node.tried_actions or node.is_goal:
+            return False
+        applicable = set(node.untried_actions)
+        priors = {}
+        for index, (visits, utility) in self.lookup(node.state).items():
+            action = self.problem.actions[index]
+            if visits and action in applicable:
+                prior_visits = min(visits, self.max_prior_visits)
+                priors[action] = (utility * prior_visits / visits, prior_visits)
+        if not priors:
+            return False
+        visits = sum(prior_visits for _, prior_visits in priors.values())
+        reward = node.effect.reward if node.effect else 0  # the reward obtained upon reaching the node
+        utility = visits * reward + discounting * sum(utility for utility, _ in priors.values())
+        node.restore(visits, utility, priors)
+        self._seeded[node] = priors
+        return True
+
+    def record(self, root, min_visits=1):
+        """ Add the statistics of a finished search tree to the store. Prior statistics with which nodes were
+            seeded by this store are left out, so that history is not counted twice. Each search tree should only
+            be recorded once, as recording it again adds its statistics again.
+        :param root: the root node of the search tree
+        :param min_visits: the minimum number of visits of a node for its statistics to be recorded
+        :return: the number of nodes recorded """
+        recorded = 0
+        with self._lock:
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                if node.visits < min_visits or not node.tried_actions:
+                    continue  # the children of a node are never visited more often than the node itself
+                priors = self._seeded.get(node, {})
+                pending = self._pending.setdefault(self.encode(node.state), {})
+                for action, (utility, visits) in node.tried_actions.items():
+                    prior_utility, prior_visits = priors.get(action, (0, 0))
+                    if visits > prior_visits:
+                        statistics = pending.setdefault(self._actions[action], [0, 0])
+                        statistics[0] += visits - prior_visits
+                        statistics[1] += utility - prior_utility
+                recorded += 1
+                stack.extend(child for (action, _), child in node.children.items() if action in node.tried_actions)
+        return recorded
+
+    def flush(self):
+        """ Write the recorded statistics to the database, mark the entries of the states looked up since the
+            previous flush as used, and evict the least recently used entries if the database holds more than
+            max_entries entries. Only committing the changes waits for lookups in progress, and vice versa. """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                read, self._read = self._read, set()
+                if not pending and not read:
+                    return
+                self._flushing = pending  # lookups keep including these statistics until they are committed
+                self._clock += 1
+                clock = self._clock
+            rows = [(key, action, visits, utility, clock)
+                    for key, actions in pending.items() for action, (visits, utility) in actions.items()]
+            evicted = []
+            try:
+                self._writer.executemany(
+                    "INSERT INTO action_values VALUES (?, ?, ?, ?, ?) ON CONFLICT (state, action) DO UPDATE SET "
+                    "visits = visits + excluded.visits, utility = utility + excluded.utility, used = excluded.used",
+                    rows)
+                self._writer.executemany("UPDATE action_values SET used = ? WHERE state = ?",
+                                         [(clock, key) for key in read if key not in pending])
+                entries, = self._writer.execute("SELECT COUNT(*) FROM action_values").fetchone()
+                if entries > self.max_entries:
+                    evicted = self._writer.execute("SELECT state, action FROM action_values ORDER BY used LIMIT ?",
+                                                   (entries - self.max_entries,)).fetchall()
+                    self._writer.executemany("DELETE FROM action_values WHERE state = ? AND action = ?", evicted)
+                self._writer.execute("UPDATE meta SET value = ? WHERE key = 'clock'", (clock,))
+            except Exception:
+                self._writer.rollback()
+                with self._lock:  # keep the statistics queued, so that they are written by the next flush instead
+                    self._flushing = {}
+                    for key, actions in pending.items():
+                        queued = self._pending.setdefault(key, {})
+                        for action, (visits, utility) in actions.items():
+                            statistics = queued.setdefault(action, [0, 0])
+                            statistics[0] += visits
+                            statistics[1] += utility
+                    self._read |= read
+                raise
+            with self._lock:  # committing makes the statistics visible to lookups, so update the cache along with it
+                self._writer.commit()
+                self._flushing = {}
+                for key, actions in pending.items():
+                    if key in self._cache:
+                        self._cache.put(key, _merge(self._cache.get(key), actions))
+                for key, _ in evicted:
+                    self._cache.pop(key)
+
+    def _flush_periodically(self, interval):
+        """ Main loop of the background thread, which flushes the recorded statistics at regular intervals. """
+        while not self._stopping.wait(interval):
+            self.flush()
+
+    def close(self):
+        """ Stop the background thread, flush the remaining statistics, and close the database. """
+        self._stopping.set()
+        self._flusher.join()
+        self.flush()
+        self._writer.close()
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM action_values").fetchone()[0]
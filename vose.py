@@ -53,9 +53,11 @@ class Vose:
             self._prob.append(1)  # set the probability to 1, as the element will occupy the entire slot
             self._alias.append((element[1], element[1]))  # set the element in both the upper and lower part of the slot
 
-    def random(self):
+    def random(self, generator=None):
         """ Randomly draw an element from the weighted list.
+        :param generator: the random.Random instance to draw with; defaults to the shared generator of the random module
         :return: a random element, drawn according to the weighted list """
-        i = int(random() * len(self._prob))
+        draw = random if generator is None else generator.random
+        i = int(draw() * len(self._prob))
         # use the probability to select one part of the slot to return
-        return self._alias[i][0] if self._prob[i] >= random() else self._alias[i][1]
+        return self._alias[i][0] if self._prob[i] >= draw() else self._alias[i][1]